@@ -5,17 +5,22 @@
 用于批量处理日历拼图任务，自动遍历指定目录下的图片文件夹，将12张日历图片按照特定规则拼接。
 """
 
+import os
 import sys
 import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from functools import lru_cache
+from multiprocessing import shared_memory
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from PIL import Image
 
 # 尝试相对导入，如果失败则使用绝对导入
 try:
-    from .utils import BACK_IMAGE, save_final_puzzle_image, add_rounded_corners_and_shadow
+    from .utils import BACK_IMAGE, log_jpeg_encoder, save_final_puzzle_image, add_rounded_corners_and_shadow, resize_lanczos
 except ImportError:
-    from utils import BACK_IMAGE, save_final_puzzle_image, add_rounded_corners_and_shadow
+    from utils import BACK_IMAGE, log_jpeg_encoder, save_final_puzzle_image, add_rounded_corners_and_shadow, resize_lanczos
 
 # 配置日志
 logging.basicConfig(
@@ -28,6 +33,14 @@ logger = logging.getLogger(__name__)
 # 常量定义
 IMGS_DIR = Path(__file__).parent / 'imgs'
 RESULT_DIR_SUFFIX = '-result'  # 结果目录后缀
+CALENDAR_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.PNG', '.JPG', '.JPEG')  # 日历图片扩展名（按优先级）
+SINGLE_WIDTH_RATIO = 0.6825  # 单张拼图中日历图片宽度占底图宽度的比例（65% * 1.05）
+SINGLE_MAX_HEIGHT_RATIO = 0.9  # 单张拼图中日历图片高度上限（留10%的边距）
+THREADS_PER_WORKER = 4  # 每个工作进程内的线程数上限；进程数取 CPU 核数 / 4，避免进程数 × 线程数远超核数
+
+# 工作进程内的底图（由 _init_worker 直接映射主进程放在共享内存中的 RGBX 像素，只读，需持有共享内存对象以保持映射有效）
+_worker_back_shm: Optional[shared_memory.SharedMemory] = None
+_worker_back_img: Optional[Image.Image] = None
 
 
 def find_calendar_images(work_dir: Path) -> List[Path]:
@@ -40,172 +53,105 @@ def find_calendar_images(work_dir: Path) -> List[Path]:
     Returns:
         排序后的图片路径列表
     """
-    images = []
+    # 扩展名优先级（同一编号存在多个文件时取排在前面的）
+    ext_priority = {ext: rank for rank, ext in enumerate(CALENDAR_IMAGE_EXTENSIONS)}
+    wanted = {str(i) for i in range(1, 13)}
 
-    # 查找1-12的图片文件
-    for i in range(1, 13):
-        # 尝试多种可能的文件扩展名
-        for ext in ['.png', '.jpg', '.jpeg', '.PNG', '.JPG', '.JPEG']:
-            img_file = work_dir / f"{i}{ext}"
-            if img_file.exists():
-                images.append(img_file)
-                break
+    # 一次 scandir 遍历目录，代替逐个编号、逐个扩展名的 exists() 探测
+    found: Dict[str, Tuple[int, Path]] = {}
+    with os.scandir(work_dir) as entries:
+        for entry in entries:
+            stem, ext = os.path.splitext(entry.name)
+            if stem not in wanted or ext not in ext_priority or not entry.is_file():
+                continue
+            rank = ext_priority[ext]
+            if stem not in found or rank < found[stem][0]:
+                found[stem] = (rank, Path(entry.path))
 
-    return sorted(images, key=lambda x: int(x.stem))
+    return [found[str(i)][1] for i in range(1, 13) if str(i) in found]
 
 
-def create_overview_puzzle(
-    back_img: Image.Image,
-    calendar_images: List[Image.Image]
-) -> Image.Image:
+def fit_size(size: Tuple[int, int], max_size: Tuple[int, int]) -> Tuple[int, int]:
     """
-    创建概览拼图：将12张日历图片按每行3张，共4行拼成一张概览图
+    计算保持宽高比、完整放入 max_size 的最大尺寸
+
+    按 min(max_w / w, max_h / h) 等比缩放，用整数运算避免浮点误差
 
     Args:
-        back_img: 背景图片（back.png）
-        calendar_images: 12张日历图片列表
+        size: 原始尺寸 (width, height)
+        max_size: 最大尺寸 (width, height)
 
     Returns:
-        拼图结果（保持背景图尺寸）
+        缩放后的尺寸 (width, height)
     """
-    back_width, back_height = back_img.size
-
-    # 确保back.png是RGB模式
-    if back_img.mode == 'RGBA':
-        bg = Image.new('RGB', back_img.size, (255, 255, 255))
-        bg.paste(back_img, mask=back_img.split()[3])
-        result_img = bg
-    elif back_img.mode != 'RGB':
-        result_img = back_img.convert('RGB')
-    else:
-        result_img = back_img.copy()
-
-    # 计算每张图片的尺寸
-    # 每行3张，共4行，需要留出间距
-    # 上半部分预留9.5%的空白（缩小5%）
-    rows = 4
-    cols = 3
-    top_margin_ratio = 0.1  # 上半部分预留10%空白
-    padding_ratio = 0.05  # 边距比例（相对于背景图宽度）
-    spacing_ratio = 0.02  # 图片间距比例（相对于背景图宽度）
-
-    top_margin = int(back_height * top_margin_ratio)
-    padding = int(back_width * padding_ratio)
-    spacing = int(back_width * spacing_ratio)
-
-    # 计算每张图片的可用宽度和高度（从20%位置开始）
-    available_width = back_width - padding * 2 - spacing * (cols - 1)
-    available_height = back_height - top_margin - padding * 2 - spacing * (rows - 1)
-
-    # 整体缩小5%
-    img_width = int(available_width // cols * 0.95)
-    img_height = int(available_height // rows * 0.95)
-
-    # 处理每张日历图片
-    processed_images = []
-    for img in calendar_images:
-        # 确保图片是RGB或RGBA模式
-        if img.mode not in ('RGB', 'RGBA'):
-            img = img.convert('RGBA')
+    width, height = size
+    max_width, max_height = max_size
+    return (
+        min(max_width, width * max_height // height),
+        min(max_height, height * max_width // width)
+    )
 
-        # 调整图片尺寸，保持宽高比
-        img_ratio = img.width / img.height
-        target_ratio = img_width / img_height
-
-        if img_ratio > target_ratio:
-            # 图片更宽，以高度为准
-            new_height = img_height
-            new_width = int(new_height * img_ratio)
-        else:
-            # 图片更高，以宽度为准
-            new_width = img_width
-            new_height = int(new_width / img_ratio)
-
-        # 如果调整后的尺寸超出，需要进一步缩放
-        if new_width > img_width:
-            new_width = img_width
-            new_height = int(new_width / img_ratio)
-        if new_height > img_height:
-            new_height = img_height
-            new_width = int(new_height * img_ratio)
-
-        resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-        # 确保图片是RGBA模式
-        if resized_img.mode != 'RGBA':
-            resized_img = resized_img.convert('RGBA')
-
-        # 直接在原图上添加圆角和阴影效果，不要有白边
-        img_with_effect = add_rounded_corners_and_shadow(
-            resized_img,
-            corner_radius=25,
-            shadow_offset=(5, 5),
-            shadow_blur=10,
-            shadow_opacity=100
-        )
 
-        processed_images.append(img_with_effect)
+def prepare_calendar_image(
+    img: Image.Image,
+    size: Tuple[int, int],
+    reducing_gap: Optional[float] = None
+) -> Image.Image:
+    """
+    缩放日历图片并添加圆角和阴影效果
 
-    # 将处理后的图片拼接到背景图上
-    # 计算整个拼图区域的尺寸（用于整体居中）
-    total_width = cols * img_width + (cols - 1) * spacing
-    total_height = rows * img_height + (rows - 1) * spacing
+    Args:
+        img: 日历图片
+        size: 缩放后的尺寸 (width, height)
+        reducing_gap: Pillow 缩放时的预缩小系数（见 resize_lanczos）
 
-    # 计算整体拼图区域的起始位置（居中）
-    start_x = (back_width - total_width) // 2
-    start_y = (back_height - total_height) // 2
+    Returns:
+        带圆角和阴影效果的图片（RGBA模式）
+    """
+    # 缩放结果只用于下面的圆角阴影合成（会复制到新缓冲区），可以复用目标缓冲区
+    resized_img = resize_lanczos(img, size, reducing_gap=reducing_gap, reuse_dst=True)
 
-    for row in range(rows):
-        for col in range(cols):
-            idx = row * cols + col
-            if idx < len(processed_images):
-                # 计算单元格的中心位置（基于整体居中后的起始位置）
-                cell_x = start_x + col * (img_width + spacing) + img_width // 2
-                cell_y = start_y + row * (img_height + spacing) + img_height // 2
+    # 直接在原图上添加圆角和阴影效果，不要有白边
+    img_with_effect = add_rounded_corners_and_shadow(
+        resized_img,
+        corner_radius=25,
+        shadow_offset=(5, 5),
+        shadow_blur=10,
+        shadow_opacity=100
+    )
 
-                # 获取处理后的图片尺寸（包括阴影边距）
-                img_with_effect = processed_images[idx]
-                effect_width, effect_height = img_with_effect.size
+    return img_with_effect
 
-                # 计算粘贴位置，使图片在单元格内居中
-                x = cell_x - effect_width // 2
-                y = cell_y - effect_height // 2
 
-                result_img.paste(img_with_effect, (x, y), img_with_effect)
+@dataclass(frozen=True)
+class OverviewLayout:
+    """
+    概览拼图布局（整数像素坐标，同一底图尺寸只计算一次）
 
-    return result_img
+    Attributes:
+        img_width: 单元格内日历图片的最大宽度
+        img_height: 单元格内日历图片的最大高度
+        cells: 每个单元格中心点坐标 (x, y)，按行优先顺序排列
+    """
+    img_width: int
+    img_height: int
+    cells: Tuple[Tuple[int, int], ...]
 
 
-def create_overview_puzzle_2x2(
-    back_img: Image.Image,
-    calendar_images: List[Image.Image]
-) -> Image.Image:
+@lru_cache(maxsize=None)
+def get_overview_layout(back_width: int, back_height: int, rows: int, cols: int) -> OverviewLayout:
     """
-    创建2x2概览拼图：将4张日历图片按每行2张，共2行拼成一张概览图
+    计算概览拼图布局：按 rows x cols 网格排列，整体居中
 
     Args:
-        back_img: 背景图片（back.png）
-        calendar_images: 4张日历图片列表
+        back_width: 背景图宽度
+        back_height: 背景图高度
+        rows: 行数
+        cols: 列数
 
     Returns:
-        拼图结果（保持背景图尺寸）
+        概览拼图布局
     """
-    back_width, back_height = back_img.size
-
-    # 确保back.png是RGB模式
-    if back_img.mode == 'RGBA':
-        bg = Image.new('RGB', back_img.size, (255, 255, 255))
-        bg.paste(back_img, mask=back_img.split()[3])
-        result_img = bg
-    elif back_img.mode != 'RGB':
-        result_img = back_img.convert('RGB')
-    else:
-        result_img = back_img.copy()
-
-    # 计算每张图片的尺寸
-    # 每行2张，共2行，需要留出间距
-    rows = 2
-    cols = 2
     top_margin_ratio = 0.1  # 上半部分预留10%空白
     padding_ratio = 0.05  # 边距比例（相对于背景图宽度）
     spacing_ratio = 0.02  # 图片间距比例（相对于背景图宽度）
@@ -222,77 +168,60 @@ def create_overview_puzzle_2x2(
     img_width = int(available_width // cols * 0.95)
     img_height = int(available_height // rows * 0.95)
 
-    # 处理每张日历图片
-    processed_images = []
-    for img in calendar_images:
-        # 确保图片是RGB或RGBA模式
-        if img.mode not in ('RGB', 'RGBA'):
-            img = img.convert('RGBA')
+    # 计算整个拼图区域的尺寸及起始位置（整体居中）
+    total_width = cols * img_width + (cols - 1) * spacing
+    total_height = rows * img_height + (rows - 1) * spacing
+    start_x = (back_width - total_width) // 2
+    start_y = (back_height - total_height) // 2
 
-        # 调整图片尺寸，保持宽高比
-        img_ratio = img.width / img.height
-        target_ratio = img_width / img_height
-
-        if img_ratio > target_ratio:
-            # 图片更宽，以高度为准
-            new_height = img_height
-            new_width = int(new_height * img_ratio)
-        else:
-            # 图片更高，以宽度为准
-            new_width = img_width
-            new_height = int(new_width / img_ratio)
-
-        # 如果调整后的尺寸超出，需要进一步缩放
-        if new_width > img_width:
-            new_width = img_width
-            new_height = int(new_width / img_ratio)
-        if new_height > img_height:
-            new_height = img_height
-            new_width = int(new_height * img_ratio)
-
-        resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-        # 确保图片是RGBA模式
-        if resized_img.mode != 'RGBA':
-            resized_img = resized_img.convert('RGBA')
-
-        # 直接在原图上添加圆角和阴影效果，不要有白边
-        img_with_effect = add_rounded_corners_and_shadow(
-            resized_img,
-            corner_radius=25,
-            shadow_offset=(5, 5),
-            shadow_blur=10,
-            shadow_opacity=100
+    # 每个单元格的中心位置
+    cells = tuple(
+        (
+            start_x + col * (img_width + spacing) + img_width // 2,
+            start_y + row * (img_height + spacing) + img_height // 2
         )
+        for row in range(rows)
+        for col in range(cols)
+    )
 
-        processed_images.append(img_with_effect)
+    return OverviewLayout(img_width=img_width, img_height=img_height, cells=cells)
 
-    # 将处理后的图片拼接到背景图上
-    # 计算整个拼图区域的尺寸（用于整体居中）
-    total_width = cols * img_width + (cols - 1) * spacing
-    total_height = rows * img_height + (rows - 1) * spacing
 
-    # 计算整体拼图区域的起始位置（居中）
-    start_x = (back_width - total_width) // 2
-    start_y = (back_height - total_height) // 2
+def create_overview_puzzle(
+    back_img: Image.Image,
+    calendar_images: Iterable[Image.Image],
+    rows: int = 4,
+    cols: int = 3
+) -> Image.Image:
+    """
+    创建概览拼图：将日历图片按 rows x cols 网格拼成一张概览图（默认每行3张，共4行）
+
+    Args:
+        back_img: 背景图片（back.png，RGB 或 RGBX 模式）
+        calendar_images: 日历图片（可以是逐张打开的迭代器，超出网格数量的图片会被忽略）
+        rows: 行数
+        cols: 列数
 
-    for row in range(rows):
-        for col in range(cols):
-            idx = row * cols + col
-            if idx < len(processed_images):
-                # 计算单元格的中心位置（基于整体居中后的起始位置）
-                cell_x = start_x + col * (img_width + spacing) + img_width // 2
-                cell_y = start_y + row * (img_height + spacing) + img_height // 2
+    Returns:
+        拼图结果（保持背景图尺寸）
+    """
+    layout = get_overview_layout(back_img.width, back_img.height, rows, cols)
+    img_width = layout.img_width
+    img_height = layout.img_height
 
-                # 获取处理后的图片尺寸（包括阴影边距）
-                img_with_effect = processed_images[idx]
-                effect_width, effect_height = img_with_effect.size
+    result_img = back_img.convert('RGB')
+
+    for img, (cell_x, cell_y) in zip(calendar_images, layout.cells):
+        # 调整图片尺寸，保持宽高比
+        new_size = fit_size(img.size, (img_width, img_height))
+        img_with_effect = prepare_calendar_image(img, new_size)
 
-                # 计算粘贴位置，使图片在单元格内居中
-                x = cell_x - effect_width // 2
-                y = cell_y - effect_height // 2
+        # 计算粘贴位置，使图片（包括阴影边距）在单元格内居中
+        effect_width, effect_height = img_with_effect.size
+        x = cell_x - effect_width // 2
+        y = cell_y - effect_height // 2
 
-                result_img.paste(img_with_effect, (x, y), img_with_effect)
+        result_img.paste(img_with_effect, (x, y), img_with_effect)
 
     return result_img
 
@@ -305,7 +234,7 @@ def create_single_calendar_puzzle(
     创建单张日历拼图：日历图片居中，宽度占底图宽度的60%
 
     Args:
-        back_img: 背景图片（back.png）
+        back_img: 背景图片（back.png，RGB 或 RGBX 模式）
         calendar_img: 日历图片
 
     Returns:
@@ -313,49 +242,18 @@ def create_single_calendar_puzzle(
     """
     back_width, back_height = back_img.size
 
-    # 确保back.png是RGB模式
-    if back_img.mode == 'RGBA':
-        bg = Image.new('RGB', back_img.size, (255, 255, 255))
-        bg.paste(back_img, mask=back_img.split()[3])
-        result_img = bg
-    elif back_img.mode != 'RGB':
-        result_img = back_img.convert('RGB')
-    else:
-        result_img = back_img.copy()
+    result_img = back_img.convert('RGB')
 
     # 计算日历图片的目标宽度（底图宽度的68.25%，即65% * 1.05）
-    target_width = int(back_width * 0.6825)
-
-    # 确保图片是RGB或RGBA模式
-    if calendar_img.mode not in ('RGB', 'RGBA'):
-        calendar_img = calendar_img.convert('RGBA')
-
-    # 调整图片尺寸，保持宽高比
-    img_ratio = calendar_img.width / calendar_img.height
-    new_width = target_width
-    new_height = int(new_width / img_ratio)
+    target_width = int(back_width * SINGLE_WIDTH_RATIO)
 
-    # 如果高度超出背景图，以高度为准重新计算
-    if new_height > back_height * 0.9:  # 留10%的边距
-        new_height = int(back_height * 0.9)
-        new_width = int(new_height * img_ratio)
+    # 调整图片尺寸，保持宽高比，高度不超过背景图的90%（留10%的边距）
+    new_size = fit_size(calendar_img.size, (target_width, int(back_height * SINGLE_MAX_HEIGHT_RATIO)))
 
-    resized_img = calendar_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-    # 添加圆角和阴影效果
-    img_with_effect = add_rounded_corners_and_shadow(
-        resized_img,
-        corner_radius=25,
-        shadow_offset=(5, 5),
-        shadow_blur=10,
-        shadow_opacity=100
-    )
-
-    # 计算居中位置（考虑阴影边距，新实现会在图片周围添加shadow_margin边距）
-    shadow_offset = (5, 5)
-    shadow_blur = 10
-    shadow_margin = max(shadow_offset) + shadow_blur
+    # 添加圆角和阴影效果（大幅缩小时先做整数倍预缩小）
+    img_with_effect = prepare_calendar_image(calendar_img, new_size, reducing_gap=3.0)
 
+    # 计算居中位置（包括阴影边距）
     effect_width, effect_height = img_with_effect.size
     paste_x = (back_width - effect_width) // 2
     paste_y = (back_height - effect_height) // 2
@@ -366,25 +264,38 @@ def create_single_calendar_puzzle(
     return result_img
 
 
+def open_calendar_image(img_file: Path, draft_size: Tuple[int, int]) -> Image.Image:
+    """
+    打开日历图片（延迟解码），JPEG 图片按 draft_size 请求 DCT 缩放以跳过多余像素
+
+    Args:
+        img_file: 图片路径
+        draft_size: JPEG 解码的最小所需尺寸 (width, height)
+
+    Returns:
+        打开的图片（调用方负责关闭）
+    """
+    img = Image.open(img_file)
+    if img.format == 'JPEG':
+        img.draft('RGB', draft_size)
+    return img
+
+
 def process_directory(work_dir: Path, back_img: Image.Image) -> bool:
     """
-    处理单个目录
+    处理单个目录（只生成结果目录中缺失的拼图，已存在的结果文件会被跳过）
 
     Args:
         work_dir: 工作目录
-        back_img: 底图
+        back_img: 底图（RGB 或 RGBX 模式）
 
     Returns:
         是否成功
     """
     logger.info(f"处理目录: {work_dir.name}")
 
-    # 检查结果目录是否已存在
     result_dir_name = f"{work_dir.name}{RESULT_DIR_SUFFIX}"
     result_dir = work_dir.parent / result_dir_name
-    if result_dir.exists() and result_dir.is_dir():
-        logger.info(f"  结果目录已存在，跳过: {result_dir_name}")
-        return True
 
     # 查找日历图片
     image_files = find_calendar_images(work_dir)
@@ -396,71 +307,134 @@ def process_directory(work_dir: Path, back_img: Image.Image) -> bool:
 
     logger.info(f"  找到 {len(image_files)} 张日历图片")
 
-    # 创建结果目录
-    result_dir.mkdir(parents=True, exist_ok=True)
-
-    # 打开所有日历图片
-    calendar_images = []
-    for img_file in image_files:
-        try:
-            img = Image.open(img_file)
-            calendar_images.append(img)
-        except Exception as e:
-            logger.error(f"  打开图片失败 {img_file.name}: {e}")
-            return False
-
-    success_count = 0
-
     # 检测back.png的比例
     back_width, back_height = back_img.size
     back_ratio = back_width / back_height
     is_square = abs(back_ratio - 1.0) < 0.01  # 允许0.01的误差
 
-    # 拼图逻辑1：创建概览图
+    # 列出所有结果文件，只处理尚不存在的部分（中断后重跑或新增图片时无需全部重做）
     if is_square:
         # 当back.png是1:1时，按每行2列共4张图作为一张拼图结果，共产生3张overview拼图结果
-        try:
-            # 将12张图片分成3组，每组4张
-            for group_idx in range(3):
-                start_idx = group_idx * 4
-                end_idx = start_idx + 4
-                group_images = calendar_images[start_idx:end_idx]
-                
-                if len(group_images) == 4:
-                    overview_img = create_overview_puzzle_2x2(back_img, group_images)
-                    overview_file = result_dir / f'overview{group_idx + 1}.jpg'
-                    save_final_puzzle_image(overview_img, overview_file)
-                    logger.info(f"  已创建概览图: overview{group_idx + 1}.jpg")
-                    success_count += 1
-        except Exception as e:
-            logger.error(f"  创建概览图失败: {e}")
+        overview_tasks = [
+            (result_dir / f'overview{group_idx + 1}.jpg', image_files[group_idx * 4:group_idx * 4 + 4], 2, 2)
+            for group_idx in range(3)
+            if len(image_files[group_idx * 4:group_idx * 4 + 4]) == 4
+        ]
     else:
         # 原有逻辑：将12张日历图片按每行3张，共4行拼成一张概览图
+        overview_tasks = [(result_dir / 'overview.jpg', image_files, 4, 3)]
+    single_tasks = [(result_dir / f"{idx}.jpg", img_file) for idx, img_file in enumerate(image_files, 1)]
+
+    overview_tasks = [task for task in overview_tasks if not task[0].exists()]
+    single_tasks = [task for task in single_tasks if not task[0].exists()]
+    if not overview_tasks and not single_tasks:
+        logger.info(f"  结果已全部存在，跳过: {result_dir_name}")
+        return True
+
+    # 创建结果目录
+    result_dir.mkdir(parents=True, exist_ok=True)
+
+    # 单张拼图是日历图片的最大输出尺寸，JPEG 解码时按其2倍请求 DCT 缩放，跳过多余像素
+    draft_size = (int(back_width * SINGLE_WIDTH_RATIO) * 2, int(back_height * SINGLE_MAX_HEIGHT_RATIO) * 2)
+
+    def iter_calendar_images(files: List[Path]) -> Iterator[Image.Image]:
+        """按需逐张打开日历图片，使用完（生成器继续前进）即关闭，同一时刻只有一张原图的像素驻留内存"""
+        for img_file in files:
+            with open_calendar_image(img_file, draft_size) as img:
+                yield img
+
+    success_count = 0
+
+    # 拼图逻辑1：创建概览图（JPEG 编码交给单独的写入线程，与后续概览图和单张拼图的合成重叠）
+    writer = ThreadPoolExecutor(max_workers=1)
+    overview_saves = {}
+    for overview_file, group_files, rows, cols in overview_tasks:
         try:
-            overview_img = create_overview_puzzle(back_img, calendar_images)
-            overview_file = result_dir / 'overview.jpg'
-            save_final_puzzle_image(overview_img, overview_file)
-            logger.info(f"  已创建概览图: overview.jpg")
-            success_count += 1
+            overview_img = create_overview_puzzle(
+                back_img, iter_calendar_images(group_files), rows=rows, cols=cols
+            )
+            overview_saves[writer.submit(save_final_puzzle_image, overview_img, overview_file)] = overview_file
         except Exception as e:
-            logger.error(f"  创建概览图失败: {e}")
+            logger.error(f"  创建概览图失败 {overview_file.name}: {e}")
 
-    # 拼图逻辑2：为每张图片创建独立拼图
-    for idx, (img_file, calendar_img) in enumerate(zip(image_files, calendar_images), 1):
+    # 拼图逻辑2：为每张图片创建独立拼图（缩放、粘贴、JPEG编码都在 Pillow 的 C 代码中释放 GIL，使用线程池并行）
+    def create_single(task) -> bool:
+        output_file, img_file = task
         try:
-            single_img = create_single_calendar_puzzle(back_img, calendar_img)
-            output_name = f"{idx}.jpg"
-            output_file = result_dir / output_name
+            with open_calendar_image(img_file, draft_size) as calendar_img:
+                single_img = create_single_calendar_puzzle(back_img, calendar_img)
             save_final_puzzle_image(single_img, output_file)
-            logger.info(f"  已处理: {img_file.name} -> {output_name}")
-            success_count += 1
+            logger.info(f"  已处理: {img_file.name} -> {output_file.name}")
+            return True
         except Exception as e:
             logger.error(f"  处理图片失败 {img_file.name}: {e}")
+            return False
+
+    if single_tasks:
+        max_workers = min(len(single_tasks), THREADS_PER_WORKER)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            success_count += sum(executor.map(create_single, single_tasks))
+
+    # 等待概览图写入完成
+    writer.shutdown(wait=True)
+    for future, overview_file in overview_saves.items():
+        try:
+            future.result()
+            logger.info(f"  已创建概览图: {overview_file.name}")
+            success_count += 1
+        except Exception as e:
+            logger.error(f"  创建概览图失败 {overview_file.name}: {e}")
 
-    logger.info(f"  处理完成: {success_count}/{len(image_files) + 1} 个文件成功")
+    logger.info(f"  处理完成: {success_count}/{len(overview_tasks) + len(single_tasks)} 个文件成功")
     return success_count > 0
 
 
+def load_back_image(back_image_path: Path) -> Image.Image:
+    """
+    打开底图并统一转换为RGB模式
+
+    Args:
+        back_image_path: 底图路径
+
+    Returns:
+        RGB模式的底图
+    """
+    back_img = Image.open(back_image_path)
+    logger.info(f"底图尺寸: {back_img.size[0]}x{back_img.size[1]}, 模式: {back_img.mode}")
+    if back_img.mode == 'RGBA':
+        bg = Image.new('RGB', back_img.size, (255, 255, 255))
+        bg.paste(back_img, mask=back_img)  # RGBA 图片直接作为遮罩（使用其透明通道）
+        back_img = bg
+    elif back_img.mode != 'RGB':
+        back_img = back_img.convert('RGB')
+    else:
+        back_img.load()
+    return back_img
+
+
+def _init_worker(shm_name: str, back_size: Tuple[int, int]) -> None:
+    """
+    工作进程初始化：直接映射主进程放在共享内存中的底图像素，既不重复解码也不复制
+
+    像素按 RGBX（每像素4字节）存放，Image.frombuffer 才能零拷贝映射（RGB 每像素3字节时会复制）；
+    映射得到的图片只读，拼图时通过 convert('RGB') 得到可修改的副本
+
+    Args:
+        shm_name: 共享内存块名称
+        back_size: 底图尺寸 (width, height)
+    """
+    global _worker_back_shm, _worker_back_img
+    _worker_back_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_back_img = Image.frombuffer('RGBX', back_size, _worker_back_shm.buf, 'raw', 'RGBX', 0, 1)
+
+
+def _process_directory_worker(work_dir: Path) -> bool:
+    """
+    工作进程任务：使用进程内缓存的底图处理单个目录
+    """
+    return process_directory(work_dir, _worker_back_img)
+
+
 def main():
     """
     主函数
@@ -470,14 +444,16 @@ def main():
         logger.error(f"底图不存在: {BACK_IMAGE}")
         sys.exit(1)
 
-    # 打开底图
+    # 打开底图并转换为RGB模式（只在主进程解码一次，通过共享内存交给各工作进程）
     try:
-        back_img = Image.open(BACK_IMAGE)
-        logger.info(f"底图尺寸: {back_img.size[0]}x{back_img.size[1]}, 模式: {back_img.mode}")
+        back_img = load_back_image(BACK_IMAGE)
+        back_size = back_img.size
     except Exception as e:
         logger.error(f"打开底图失败: {e}")
         sys.exit(1)
 
+    log_jpeg_encoder()
+
     # 检查 imgs 目录
     if not IMGS_DIR.exists():
         logger.error(f"图片目录不存在: {IMGS_DIR}")
@@ -492,17 +468,35 @@ def main():
 
     logger.info(f"找到 {len(subdirs)} 个子目录")
 
-    # 处理每个目录
+    # 多进程并行处理每个目录
     logger.info("=" * 50)
     logger.info("处理日历拼图")
     logger.info("=" * 50)
     success_count = 0
-    for subdir in subdirs:
-        try:
-            if process_directory(subdir, back_img):
-                success_count += 1
-        except Exception as e:
-            logger.error(f"处理目录 {subdir.name} 时发生错误: {e}")
+    max_workers = min(max(1, (os.cpu_count() or 1) // THREADS_PER_WORKER), len(subdirs))
+
+    # 底图按 RGBX 放入共享内存，各工作进程直接映射，不再各持一份副本
+    back_bytes = back_img.convert('RGBX').tobytes()
+    back_shm = shared_memory.SharedMemory(create=True, size=len(back_bytes))
+    try:
+        back_shm.buf[:len(back_bytes)] = back_bytes
+        del back_bytes, back_img
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(back_shm.name, back_size)
+        ) as executor:
+            futures = {executor.submit(_process_directory_worker, subdir): subdir for subdir in subdirs}
+            for future in as_completed(futures):
+                subdir = futures[future]
+                try:
+                    if future.result():
+                        success_count += 1
+                except Exception as e:
+                    logger.error(f"处理目录 {subdir.name} 时发生错误: {e}")
+    finally:
+        back_shm.close()
+        back_shm.unlink()
 
     logger.info(f"日历拼图处理完成: {success_count}/{len(subdirs)} 个目录成功")
 
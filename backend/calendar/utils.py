@@ -5,9 +5,21 @@
 包含拼图处理所需的公共工具函数
 """
 
+import io
 import logging
+import threading
+from functools import lru_cache
 from pathlib import Path
-from PIL import Image, ImageDraw, ImageFilter
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, features
+
+# cykooz.resizer 为可选依赖（Rust SIMD 实现，会自动选择 AVX2/SSE4.1 指令集），未安装时回退到 Pillow
+try:
+    from cykooz_resizer import FilterType, ResizeAlg, ResizeOptions, Resizer
+except ImportError:
+    Resizer = None
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +29,123 @@ BACK_IMAGE = Path(__file__).parent / 'back.png'
 # 输出图片配置
 FINAL_PUZZLE_MIN_SIZE = 200 * 1024  # 200KB（最终拼图结果最小大小）
 FINAL_PUZZLE_MAX_SIZE = 300 * 1024  # 300KB（最终拼图结果最大大小）
+JPEG_SUBSAMPLING = 2  # 4:2:0 色度抽样（排版类图片肉眼无差别，编码数据量最小）
+
+# Lanczos3 缩放器及目标缓冲区（每个线程复用一个实例，Resizer 内部缓冲区不能在线程间共享）
+_resizer_local = threading.local()
+if Resizer is not None:
+    _RESIZE_OPTIONS = ResizeOptions(resize_alg=ResizeAlg.convolution(FilterType.lanczos3))
+
+
+def _get_resizer() -> Optional['Resizer']:
+    """
+    获取当前线程的 Lanczos3 缩放器，未安装 cykooz.resizer 时返回 None
+    """
+    if Resizer is None:
+        return None
+    resizer = getattr(_resizer_local, 'resizer', None)
+    if resizer is None:
+        resizer = _resizer_local.resizer = Resizer()
+    return resizer
+
+
+def resize_lanczos(
+    image: Image.Image,
+    size: tuple,
+    reducing_gap: Optional[float] = None,
+    reuse_dst: bool = False
+) -> Image.Image:
+    """
+    使用 Lanczos3 算法缩放图片，优先使用 cykooz.resizer，未安装时回退到 Pillow
+
+    Args:
+        image: 原始图片
+        size: 目标尺寸 (width, height)
+        reducing_gap: 回退到 Pillow 时使用，先按整数倍快速缩小到目标尺寸的 reducing_gap 倍再做 Lanczos
+        reuse_dst: 使用 cykooz.resizer 时复用当前线程中同模式、同尺寸的目标图片，
+            返回的图片在本线程下一次缩放前有效（调用方需立即使用或复制）
+
+    Returns:
+        缩放后的图片（RGB 原图保持 RGB，其余模式为 RGBA；不在原始分辨率上做模式转换）
+    """
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+
+    resizer = _get_resizer()
+    if resizer is None:
+        return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
+
+    if reuse_dst:
+        # 同一组日历图片通常尺寸相同，缩放到同一目标尺寸时复用同一块缓冲区
+        key = (image.mode, tuple(size))
+        if getattr(_resizer_local, 'dst_key', None) != key:
+            _resizer_local.dst = Image.new(image.mode, size)
+            _resizer_local.dst_key = key
+        dst = _resizer_local.dst
+    else:
+        dst = Image.new(image.mode, size)
+    resizer.resize_pil(image, dst, _RESIZE_OPTIONS)
+    return dst
+
+
+@lru_cache(maxsize=32)
+def _effect_layers(
+    width: int,
+    height: int,
+    corner_radius: int,
+    shadow_offset: tuple,
+    shadow_blur: int,
+    shadow_opacity: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    生成圆角遮罩和模糊后的阴影画布，同一尺寸的日历图片共用一份（高斯模糊是整个效果中最耗时的一步）
+
+    阴影是纯黑色，只需对单通道做高斯模糊（原先对整张 RGBA 画布模糊，数据量是4倍），
+    且只需模糊边缘附近的一小块（见下方说明）
+
+    Returns:
+        (圆角遮罩, 阴影画布)：形状为 (height, width) 的 bool 数组，
+        以及形状为 (阴影画布高, 阴影画布宽, 4) 的 uint8 RGBA 数组（均只读）
+    """
+    mask = Image.new('L', (width, height), 0)
+    ImageDraw.Draw(mask).rounded_rectangle([(0, 0), (width, height)], radius=corner_radius, fill=255)
+    mask_arr = np.asarray(mask) != 0
+
+    pad_x = abs(shadow_offset[0]) + shadow_blur
+    pad_y = abs(shadow_offset[1]) + shadow_blur
+
+    # 圆角矩形的阴影只在边缘附近变化，中间部分每行（列）都相同：
+    # 只模糊一个边长不超过 2 * edge 的小圆角矩形，再重复其中间行（列）展开到目标尺寸，结果与直接模糊完全一致
+    edge = corner_radius + shadow_blur * 4 + 2
+    small_width = min(width, edge * 2)
+    small_height = min(height, edge * 2)
+    shadow = Image.new('L', (small_width + pad_x * 2, small_height + pad_y * 2), 0)
+    ImageDraw.Draw(shadow).rounded_rectangle(
+        [(pad_x, pad_y), (pad_x + small_width, pad_y + small_height)],
+        radius=corner_radius,
+        fill=shadow_opacity
+    )
+    shadow = shadow.filter(ImageFilter.GaussianBlur(radius=shadow_blur))
+
+    def stretch_index(small_len: int, full_len: int, pad: int) -> np.ndarray:
+        mid = pad + small_len // 2
+        return np.concatenate([
+            np.arange(mid),
+            np.full(full_len - small_len, mid),
+            np.arange(mid, small_len + pad * 2)
+        ])
+
+    rows = stretch_index(small_height, height, pad_y)
+    cols = stretch_index(small_width, width, pad_x)
+    alpha = np.asarray(shadow, dtype=np.uint16)[np.ix_(rows, cols)]
+
+    # 阴影以自身为遮罩贴到透明画布上：RGB 为黑色，透明度为 a * a / 255
+    shadow_arr = np.zeros(alpha.shape + (4,), dtype=np.uint8)
+    shadow_arr[..., 3] = (alpha * alpha + 127) // 255
+
+    mask_arr.flags.writeable = False
+    shadow_arr.flags.writeable = False
+    return mask_arr, shadow_arr
 
 
 def add_rounded_corners_and_shadow(
@@ -28,82 +157,136 @@ def add_rounded_corners_and_shadow(
 ) -> Image.Image:
     """
     为图片添加圆角和阴影效果
-    
+
+    圆角遮罩、阴影和图片合成在同一个 numpy 缓冲区中完成，不再创建中间的 PIL 图片
+
     Args:
         image: 原始图片
         corner_radius: 圆角半径（像素）
         shadow_offset: 阴影偏移量 (x, y)
         shadow_blur: 阴影模糊半径
         shadow_opacity: 阴影透明度（0-255）
-    
+
     Returns:
         添加了圆角和阴影效果的图片（RGBA模式）
     """
-    # 确保图片是RGBA模式
-    if image.mode != 'RGBA':
-        if image.mode == 'RGB':
-            image = image.convert('RGBA')
-        else:
-            image = image.convert('RGBA')
-    
+    # RGB 图片视为完全不透明，无需先转换为 RGBA
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+
     width, height = image.size
-    
-    # 创建圆角遮罩
-    mask = Image.new('L', (width, height), 0)
-    draw = ImageDraw.Draw(mask)
-    
-    # 绘制圆角矩形
-    draw.rounded_rectangle(
-        [(0, 0), (width, height)],
-        radius=corner_radius,
-        fill=255
-    )
-    
-    # 应用圆角遮罩
-    rounded_image = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-    rounded_image.paste(image, (0, 0), mask)
-    
-    # 创建阴影
-    shadow_size = (
-        width + abs(shadow_offset[0]) * 2 + shadow_blur * 2,
-        height + abs(shadow_offset[1]) * 2 + shadow_blur * 2
-    )
-    shadow = Image.new('RGBA', shadow_size, (0, 0, 0, 0))
-    shadow_draw = ImageDraw.Draw(shadow)
-    
-    # 计算阴影位置（居中）
-    shadow_x = abs(shadow_offset[0]) + shadow_blur
-    shadow_y = abs(shadow_offset[1]) + shadow_blur
-    
-    # 绘制阴影（黑色半透明圆角矩形）
-    shadow_draw.rounded_rectangle(
-        [
-            (shadow_x, shadow_y),
-            (shadow_x + width, shadow_y + height)
-        ],
-        radius=corner_radius,
-        fill=(0, 0, 0, shadow_opacity)
-    )
-    
-    # 模糊阴影
-    shadow = shadow.filter(ImageFilter.GaussianBlur(radius=shadow_blur))
-    
-    # 将阴影和图片合成
-    result = Image.new('RGBA', shadow_size, (0, 0, 0, 0))
-    result.paste(shadow, (0, 0), shadow)
-    
-    # 计算图片在结果中的位置（考虑阴影偏移）
+    mask, shadow = _effect_layers(width, height, corner_radius, tuple(shadow_offset), shadow_blur, shadow_opacity)
+
+    # 结果缓冲区从缓存的阴影画布复制
+    result = shadow.copy()
+
+    # 图片在结果中的位置（考虑阴影偏移）
     img_x = abs(shadow_offset[0]) + shadow_blur
     img_y = abs(shadow_offset[1]) + shadow_blur
-    result.paste(rounded_image, (img_x, img_y), rounded_image)
-    
-    return result
+    region = result[img_y:img_y + height, img_x:img_x + width]
+
+    # 圆角外透明度为0，圆角内按图片自身透明度与阴影混合（与 Image.paste 的遮罩混合一致）
+    src = np.asarray(image)
+    if image.mode == 'RGB':
+        alpha = mask * np.uint16(255)
+    else:
+        alpha = np.where(mask, src[..., 3], 0).astype(np.uint16)
+    inv_alpha = 255 - alpha
+    region[..., :3] = (src[..., :3] * alpha[..., None] + 127) // 255
+    region[..., 3] = (alpha * alpha + region[..., 3] * inv_alpha + 127) // 255
+
+    return Image.fromarray(result, 'RGBA')
+
+
+def log_jpeg_encoder() -> None:
+    """
+    记录当前 Pillow 使用的 JPEG 编码库，便于确认是否启用了 libjpeg-turbo 的 SIMD 加速
+    """
+    if features.check_feature('libjpeg_turbo'):
+        logger.info(f"JPEG 编码库: libjpeg-turbo {features.version_feature('libjpeg_turbo')}")
+    else:
+        logger.warning(f"JPEG 编码库: libjpeg {features.version('jpg')}（未使用 libjpeg-turbo，编码速度较慢）")
+
+
+def _encode_jpeg(image: Image.Image, quality: int, optimize: bool = False) -> bytes:
+    """
+    在内存中编码 JPEG，不写磁盘
+
+    Args:
+        image: RGB 图片
+        quality: JPEG 质量
+        optimize: 是否优化霍夫曼表（更慢，文件略小）
+
+    Returns:
+        JPEG 数据
+    """
+    buf = io.BytesIO()
+    image.save(buf, 'JPEG', quality=quality, optimize=optimize, subsampling=JPEG_SUBSAMPLING)
+    return buf.getvalue()
+
+
+def _search_jpeg_quality(
+    image: Image.Image,
+    min_size: int,
+    max_size: int,
+    target_size: int,
+    min_quality: int = 30,
+    max_quality: int = 95,
+    first_quality: Optional[int] = None
+) -> Tuple[int, bytes, bool]:
+    """
+    二分查找 JPEG 质量，使文件大小落在 [min_size, max_size] 之间
+
+    文件大小随质量单调增加：偏大时降低质量，偏小或已在范围内时提高质量，最终返回范围内的最高质量。
+    试探时即使用 optimize=True 编码，按最终写入的文件大小判断是否落在范围内；
+    指定 first_quality 时先试探该质量，再在剩余区间内二分
+
+    Args:
+        image: RGB 图片
+        min_size: 最小文件大小（字节）
+        max_size: 最大文件大小（字节）
+        target_size: 目标文件大小（字节），未命中范围时取最接近它的结果
+        min_quality: 最低质量
+        max_quality: 最高质量
+        first_quality: 首次试探的质量（可选）
+
+    Returns:
+        (质量, JPEG 数据, 是否落在范围内)
+    """
+    in_range_quality, in_range_data = max_quality, b''
+    best_quality, best_data = max_quality, b''
+    lo, hi = min_quality, max_quality
+    while lo <= hi:
+        if first_quality is not None and lo <= first_quality <= hi:
+            quality, first_quality = first_quality, None
+        else:
+            quality = (lo + hi) // 2
+        data = _encode_jpeg(image, quality, optimize=True)
+        size = len(data)
+
+        if min_size <= size <= max_size:
+            # 命中范围后继续向上查找，保留范围内的最高质量
+            in_range_quality, in_range_data = quality, data
+        elif not best_data or abs(size - target_size) < abs(len(best_data) - target_size):
+            # 记录最接近目标大小的质量
+            best_quality, best_data = quality, data
+
+        if size > max_size:
+            hi = quality - 1
+        else:
+            lo = quality + 1
+
+    if in_range_data:
+        return in_range_quality, in_range_data, True
+    return best_quality, best_data, False
 
 
 def save_final_puzzle_image(image: Image.Image, output_file: Path, target_size: int = 250 * 1024) -> None:
     """
     保存最终拼图结果图片，统一压缩到200-300KB之间
 
+    质量搜索在内存中完成（先试探最高质量，再二分查找，找出落在范围内的最高质量），最终只写一次磁盘
+
     Args:
         image: 图片对象
         output_file: 输出文件路径
@@ -120,7 +303,7 @@ def save_final_puzzle_image(image: Image.Image, output_file: Path, target_size:
     # 确保图片是 RGB 模式（JPEG 不支持透明通道）
     if image.mode == 'RGBA':
         bg = Image.new('RGB', image.size, (255, 255, 255))
-        bg.paste(image, mask=image.split()[3])
+        bg.paste(image, mask=image)  # RGBA 图片直接作为遮罩（使用其透明通道）
         image = bg
     elif image.mode != 'RGB':
         image = image.convert('RGB')
@@ -129,67 +312,24 @@ def save_final_puzzle_image(image: Image.Image, output_file: Path, target_size:
     if output_file.suffix.lower() == '.png':
         output_file = output_file.with_suffix('.jpg')
 
-    # 先尝试高质量保存，检查文件大小
-    current_quality = 95
-    best_quality = current_quality
-    best_size = 0
-
-    # 从高质量开始逐步降低，找到最接近目标大小的质量
-    while current_quality >= 30:
-        image.save(output_file, 'JPEG', quality=current_quality, optimize=True)
-        file_size = output_file.stat().st_size
-
-        # 如果文件大小在目标范围内，直接返回
-        if min_size <= file_size <= max_size:
-            logger.info(f"  已保存最终拼图结果，质量: {current_quality}，大小: {file_size / 1024:.2f}KB")
-            return
-
-        # 记录最接近目标大小的质量
-        if best_size == 0 or abs(file_size - target_size) < abs(best_size - target_size):
-            best_quality = current_quality
-            best_size = file_size
-
-        # 如果文件太大，继续降低质量
-        if file_size > max_size:
-            current_quality -= 5
-        # 如果文件太小，需要提高质量（但我们已经从高到低，所以这种情况不应该发生）
-        else:
-            break
+    # 先试探最高质量：细节少的图片在95时就落在范围内，保持与原先逐级降低时相同的画质
+    quality, data, in_range = _search_jpeg_quality(image, min_size, max_size, target_size, first_quality=95)
+    resized = False
 
-    # 如果找到的质量对应的文件大小不在范围内，需要调整
-    if best_size > max_size:
-        # 文件太大，需要缩小尺寸
+    if not in_range and len(data) > max_size:
+        # 最低质量仍然太大，需要缩小尺寸
         # 计算缩放比例，使文件大小接近目标大小
-        scale = (target_size / best_size) ** 0.5
+        scale = (target_size / len(data)) ** 0.5
         new_size = (int(image.width * scale), int(image.height * scale))
-        resized_image = image.resize(new_size, Image.Resampling.LANCZOS)
-
-        # 重新尝试保存，从较高质量开始
-        current_quality = 85
-        while current_quality >= 30:
-            resized_image.save(output_file, 'JPEG', quality=current_quality, optimize=True)
-            file_size = output_file.stat().st_size
-
-            if min_size <= file_size <= max_size:
-                logger.info(f"  已缩小尺寸并保存最终拼图结果，质量: {current_quality}，大小: {file_size / 1024:.2f}KB")
-                return
-
-            if file_size > max_size:
-                current_quality -= 5
-            else:
-                # 文件太小，使用当前质量即可
-                logger.info(f"  已缩小尺寸并保存最终拼图结果，质量: {current_quality}，大小: {file_size / 1024:.2f}KB")
-                return
-
-        # 如果还是太大，使用最低质量
-        resized_image.save(output_file, 'JPEG', quality=30, optimize=True)
-        file_size = output_file.stat().st_size
-        logger.info(f"  已缩小尺寸并保存最终拼图结果（最低质量），大小: {file_size / 1024:.2f}KB")
-    elif best_size < min_size:
-        # 文件太小，使用最佳质量即可（这种情况很少见）
-        image.save(output_file, 'JPEG', quality=best_quality, optimize=True)
-        logger.info(f"  已保存最终拼图结果，质量: {best_quality}，大小: {best_size / 1024:.2f}KB")
+        image = image.resize(new_size, Image.Resampling.LANCZOS)
+        resized = True
+
+        # 重新搜索，最高从85开始
+        quality, data, in_range = _search_jpeg_quality(image, min_size, max_size, target_size, max_quality=85)
+
+    output_file.write_bytes(data)
+    file_size = len(data)
+    if resized:
+        logger.info(f"  已缩小尺寸并保存最终拼图结果，质量: {quality}，大小: {file_size / 1024:.2f}KB")
     else:
-        # 使用最佳质量
-        image.save(output_file, 'JPEG', quality=best_quality, optimize=True)
-        logger.info(f"  已保存最终拼图结果，质量: {best_quality}，大小: {best_size / 1024:.2f}KB")
+        logger.info(f"  已保存最终拼图结果，质量: {quality}，大小: {file_size / 1024:.2f}KB")
@@ -5,22 +5,27 @@
 用于批量处理情侣头像拼图任务，自动遍历指定目录下的图片文件夹，将成对的图片按照特定规则拼接成新的图片。
 """
 
+import os
 import sys
 import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import shared_memory
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Callable, List, Set, Tuple, Optional
 from PIL import Image
 
 # 尝试相对导入，如果失败则使用绝对导入
 try:
     from .utils import (
         BACK_IMAGE, BACK1_IMAGE, add_shadow_and_rounded_corners, 
-        save_final_puzzle_image, create_circular_image, create_rounded_square_image
+        save_final_puzzle_image, create_circular_image, create_rounded_square_image, log_jpeg_encoder,
+        resize_lanczos, flatten_to_rgb
     )
 except ImportError:
     from utils import (
         BACK_IMAGE, BACK1_IMAGE, add_shadow_and_rounded_corners, 
-        save_final_puzzle_image, create_circular_image, create_rounded_square_image
+        save_final_puzzle_image, create_circular_image, create_rounded_square_image, log_jpeg_encoder,
+        resize_lanczos, flatten_to_rgb
     )
 
 # 配置日志
@@ -34,6 +39,25 @@ logger = logging.getLogger(__name__)
 # 常量定义
 IMGS_DIR = Path(__file__).parent / 'imgs'
 RESULT_DIR_NAME_SINGLE = 'single-result'  # 单个头像处理结果目录
+THREADS_PER_WORKER = 4  # 每个工作进程内的线程数上限；进程数取 CPU 核数 / 4，避免进程数 × 线程数远超核数
+
+# 工作进程内的底图（由 _init_worker 直接映射主进程放在共享内存中的像素，只读，需持有共享内存对象以保持映射有效）
+_worker_back_shm: Optional[shared_memory.SharedMemory] = None
+_worker_back_img: Optional[Image.Image] = None
+
+
+def list_png_names(work_dir: Path) -> Set[str]:
+    """
+    列出目录下所有 .png 文件的文件名（一次 scandir，不逐个 stat）
+
+    Args:
+        work_dir: 工作目录
+
+    Returns:
+        文件名集合
+    """
+    with os.scandir(work_dir) as entries:
+        return {entry.name for entry in entries if entry.name.endswith('.png') and entry.is_file()}
 
 
 def find_image_pairs(work_dir: Path) -> List[Tuple[Path, Path]]:
@@ -48,28 +72,78 @@ def find_image_pairs(work_dir: Path) -> List[Tuple[Path, Path]]:
     """
     pairs = []
     
-    # 查找所有 -a.png 文件
-    a_files = sorted(work_dir.glob('*-a.png'))
+    # 一次 scandir 遍历目录，代替 glob + 逐个 exists() 探测
+    png_names = list_png_names(work_dir)
     
-    for a_file in a_files:
-        # 构造对应的 b 文件路径
-        b_file_name = a_file.name.replace('-a.png', '-b.png')
-        b_file = work_dir / b_file_name
+    # 查找所有 -a.png 文件
+    for a_name in sorted(name for name in png_names if name.endswith('-a.png')):
+        # 构造对应的 b 文件名
+        b_file_name = a_name.replace('-a.png', '-b.png')
         
-        if b_file.exists():
-            pairs.append((a_file, b_file))
+        if b_file_name in png_names:
+            pairs.append((work_dir / a_name, work_dir / b_file_name))
         else:
             logger.warning(f"  未找到配对文件: {b_file_name}")
     
     return pairs
 
 
+def couple_avatar_size(back_img: Image.Image) -> int:
+    """
+    情侣头像拼图中每张头像的最大边长（底图较小边的45%）
+
+    Args:
+        back_img: 底图
+
+    Returns:
+        头像最大边长（像素）
+    """
+    return int(min(back_img.size) * 0.45)
+
+
+def open_avatar(avatar_file: Path, min_size: int) -> Image.Image:
+    """
+    打开头像图片，JPEG 数据按 min_size 请求 DCT 缩放，只解码需要的分辨率
+
+    Args:
+        avatar_file: 图片路径
+        min_size: 后续处理所需的最小边长（裁剪为正方形后不小于该值）
+
+    Returns:
+        RGB 或 RGBA 模式的图片
+    """
+    img = Image.open(avatar_file)
+    if img.format == 'JPEG':
+        img.draft('RGB', (min_size, min_size))
+
+    # 确保图片是 RGB 或 RGBA 模式
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA')
+    return img
+
+
+def prepare_couple_back(back_img: Image.Image) -> Image.Image:
+    """
+    将底图转换为RGB模式（透明部分使用白色背景）
+
+    Args:
+        back_img: 原始back.png底图
+
+    Returns:
+        RGB模式的底图（总是新图片，不与 back_img 共享像素，可直接修改）
+    """
+    rgb_img = flatten_to_rgb(back_img)
+    # 原图已是RGB时 flatten_to_rgb 直接返回原图，需复制
+    return rgb_img.copy() if rgb_img is back_img else rgb_img
+
+
 def create_couple_puzzle(
     back_img: Image.Image,
     img_a: Image.Image,
     img_b: Image.Image,
     horizontal_spacing_ratio: float = 0.15,
-    vertical_offset_ratio: float = 0.25
+    vertical_offset_ratio: float = 0.25,
+    precomputed_back: Optional[Image.Image] = None
 ) -> Image.Image:
     """
     创建情侣头像拼图
@@ -80,6 +154,7 @@ def create_couple_puzzle(
         img_b: 第二张图片（右侧）
         horizontal_spacing_ratio: 水平间距比例（相对于图片宽度）
         vertical_offset_ratio: 垂直错位比例（相对于图片高度）
+        precomputed_back: prepare_couple_back(back_img) 的结果（可选，同一目录内复用，不会被修改）
     
     Returns:
         拼图结果（保持底图比例）
@@ -87,19 +162,15 @@ def create_couple_puzzle(
     # 直接使用back.png作为底图，去掉磨玻璃效果
     back_width, back_height = back_img.size
     
-    # 确保back.png是RGB模式
-    if back_img.mode == 'RGBA':
-        # 如果有透明通道，转换为RGB（使用白色背景）
-        bg = Image.new('RGB', back_img.size, (255, 255, 255))
-        bg.paste(back_img, mask=back_img.split()[3])
-        final_back_img = bg
-    elif back_img.mode != 'RGB':
-        final_back_img = back_img.convert('RGB')
+    # 结果图片：RGB模式的底图（批量处理时由调用方预先转换一次，需复制后再粘贴；
+    # 否则 prepare_couple_back 返回的是新图片，直接使用）
+    if precomputed_back is not None:
+        result_img = precomputed_back.copy()
     else:
-        final_back_img = back_img.copy()
+        result_img = prepare_couple_back(back_img)
     
     # 计算图片的最大尺寸（使用底图的较小尺寸的45%，放大图片）
-    max_size = int(min(back_width, back_height) * 0.45)
+    max_size = couple_avatar_size(back_img)
     
     # 调整图片尺寸（保持1:1比例）
     if img_a.width != img_a.height:
@@ -115,23 +186,16 @@ def create_couple_puzzle(
         top = (img_b.height - size) // 2
         img_b = img_b.crop((left, top, left + size, top + size))
     
-    # 缩放图片到最大尺寸
+    # 缩放图片到最大尺寸（SIMD 缩放；回退到 Pillow 时大幅缩小先做整数倍预缩小）
     if img_a.width > max_size:
-        img_a = img_a.resize((max_size, max_size), Image.Resampling.LANCZOS)
+        img_a = resize_lanczos(img_a, (max_size, max_size), reducing_gap=3.0)
     if img_b.width > max_size:
-        img_b = img_b.resize((max_size, max_size), Image.Resampling.LANCZOS)
+        img_b = resize_lanczos(img_b, (max_size, max_size), reducing_gap=3.0)
     
     # 添加圆角和阴影效果
     img_a_with_effects = add_shadow_and_rounded_corners(img_a)
     img_b_with_effects = add_shadow_and_rounded_corners(img_b)
     
-    # 使用处理后的背景底图
-    result_img = final_back_img.copy()
-    
-    # 确保result_img是RGB模式
-    if result_img.mode != 'RGB':
-        result_img = result_img.convert('RGB')
-    
     # 计算水平间距（相对于图片宽度）
     horizontal_spacing = int(max(img_a_with_effects.width, img_b_with_effects.width) * horizontal_spacing_ratio)
     
@@ -156,7 +220,7 @@ def create_couple_puzzle(
     right_x = start_x + img_a_with_effects.width + horizontal_spacing
     right_y = center_y - img_b_with_effects.height // 2 + vertical_offset
     
-    # 确保图片不超出边界
+    # 确保图片不超出边界（整体平移到底图内；paste 本身只会裁掉越界部分，不能省略）
     left_x = max(0, min(left_x, back_width - img_a_with_effects.width))
     left_y = max(0, min(left_y, back_height - img_a_with_effects.height))
     right_x = max(0, min(right_x, back_width - img_b_with_effects.width))
@@ -201,21 +265,20 @@ def process_directory(work_dir: Path, back_img: Image.Image) -> bool:
     # 创建结果目录
     result_dir.mkdir(parents=True, exist_ok=True)
     
-    success_count = 0
-    for a_file, b_file in pairs:
+    # 底图的RGB转换与配对无关，每个目录只做一次
+    final_back_img = prepare_couple_back(back_img)
+    avatar_size = couple_avatar_size(back_img)
+
+    # 每对图片相互独立（解码、缩放、粘贴、JPEG编码都在 Pillow 的 C 代码中释放 GIL，使用线程池并行）
+    def process_pair(pair: Tuple[Path, Path]) -> bool:
+        a_file, b_file = pair
         try:
-            # 打开图片
-            img_a = Image.open(a_file)
-            img_b = Image.open(b_file)
-            
-            # 确保图片是 RGB 或 RGBA 模式
-            if img_a.mode not in ('RGB', 'RGBA'):
-                img_a = img_a.convert('RGBA')
-            if img_b.mode not in ('RGB', 'RGBA'):
-                img_b = img_b.convert('RGBA')
+            # 打开图片（JPEG 只解码到头像所需的分辨率）
+            img_a = open_avatar(a_file, avatar_size)
+            img_b = open_avatar(b_file, avatar_size)
             
             # 创建拼图
-            puzzle_img = create_couple_puzzle(back_img, img_a, img_b)
+            puzzle_img = create_couple_puzzle(back_img, img_a, img_b, precomputed_back=final_back_img)
             
             # 生成输出文件名（使用 a 文件的名称，去掉 -a.png，添加 .jpg）
             output_name = a_file.stem.replace('-a', '') + '.jpg'
@@ -225,50 +288,76 @@ def process_directory(work_dir: Path, back_img: Image.Image) -> bool:
             save_final_puzzle_image(puzzle_img, output_file)
             
             logger.info(f"  已处理: {a_file.name} + {b_file.name} -> {output_name}")
-            success_count += 1
+            return True
             
         except Exception as e:
             logger.error(f"  处理图片配对失败 {a_file.name} + {b_file.name}: {e}")
+            return False
+
+    max_workers = min(len(pairs), THREADS_PER_WORKER)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        success_count = sum(executor.map(process_pair, pairs))
     
     logger.info(f"  处理完成: {success_count}/{len(pairs)} 对图片成功")
     return success_count > 0
 
 
-def create_single_avatar_display(
-    avatar_img: Image.Image, 
-    back_img: Image.Image,
-    circle_img: Optional[Image.Image] = None,
-    circle_position: str = 'right'  # 'right' 右下角, 'left' 左下角
-) -> Image.Image:
+def prepare_display_back(back_img: Image.Image) -> Image.Image:
     """
-    创建单个头像的3:4展示页面
-    
+    创建单个头像展示页的3:4底图画布（底图缩放后粘贴到RGB画布上）
+
     Args:
-        avatar_img: 方形头像图片
         back_img: 底图
-        circle_img: 圆形头像图片（如果为None，则使用avatar_img）
-        circle_position: 圆形图片位置，'right'为右下角，'left'为左下角
-    
+
     Returns:
-        3:4比例的展示图片
+        3:4比例的RGB画布（总是新图片，可直接修改）
     """
     # 计算3:4比例的尺寸（基于底图宽度）
     target_width = back_img.width
     target_height = int(target_width * 4 / 3)
-    
+
     # 如果底图高度不够，以高度为准
     if target_height > back_img.height:
         target_height = back_img.height
         target_width = int(target_height * 3 / 4)
-    
+
     # 创建3:4比例的画布
     canvas = Image.new('RGB', (target_width, target_height), (255, 255, 255))
-    
+
     # 缩放底图以适应画布
-    back_resized = back_img.resize((target_width, target_height), Image.Resampling.LANCZOS)
-    
+    back_resized = back_img.resize((target_width, target_height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
     # 将底图粘贴到画布
     canvas.paste(back_resized, (0, 0))
+    return canvas
+
+
+def create_single_avatar_display(
+    avatar_img: Image.Image, 
+    back_img: Image.Image,
+    circle_img: Optional[Image.Image] = None,
+    circle_position: str = 'right',  # 'right' 右下角, 'left' 左下角
+    precomputed_back: Optional[Image.Image] = None
+) -> Image.Image:
+    """
+    创建单个头像的3:4展示页面
+    
+    Args:
+        avatar_img: 方形头像图片
+        back_img: 底图
+        circle_img: 圆形头像图片（如果为None，则使用avatar_img）
+        circle_position: 圆形图片位置，'right'为右下角，'left'为左下角
+        precomputed_back: prepare_display_back(back_img) 的结果（可选，同一目录内复用，不会被修改）
+    
+    Returns:
+        3:4比例的展示图片
+    """
+    # 3:4比例的画布（批量处理时由调用方预先缩放一次底图，需复制后再粘贴）
+    if precomputed_back is not None:
+        canvas = precomputed_back.copy()
+    else:
+        canvas = prepare_display_back(back_img)
+    target_width, target_height = canvas.size
     
     # 计算方形头像的尺寸（使用画布宽度的70%）
     square_size = int(target_width * 0.7)
@@ -276,7 +365,7 @@ def create_single_avatar_display(
     # 创建圆角方形头像
     square_img = create_rounded_square_image(avatar_img, radius=30)
     if square_img.width != square_size:
-        square_img = square_img.resize((square_size, square_size), Image.Resampling.LANCZOS)
+        square_img = square_img.resize((square_size, square_size), Image.Resampling.LANCZOS, reducing_gap=3.0)
     
     # 添加阴影效果
     square_img_with_effects = add_shadow_and_rounded_corners(square_img, radius=30)
@@ -290,7 +379,7 @@ def create_single_avatar_display(
     circle_source_img = circle_img if circle_img is not None else avatar_img
     circle_img_processed = create_circular_image(circle_source_img, border_width=8, outer_border_width=24)
     if circle_img_processed.width != circle_diameter:
-        circle_img_processed = circle_img_processed.resize((circle_diameter, circle_diameter), Image.Resampling.LANCZOS)
+        circle_img_processed = circle_img_processed.resize((circle_diameter, circle_diameter), Image.Resampling.LANCZOS, reducing_gap=3.0)
     
     # 计算方形图片的位置（居中上方）
     square_x = (target_width - square_img_with_effects.width) // 2
@@ -349,26 +438,8 @@ def process_single_avatars(work_dir: Path, back_img: Image.Image) -> bool:
         logger.info(f"  结果目录已存在，跳过: {result_dir_name}")
         return True
     
-    # 查找所有头像文件
-    a_files = sorted(work_dir.glob('*-a.png'))
-    b_files = sorted(work_dir.glob('*-b.png'))
-    other_files = []
-    
-    # 查找其他非成对的图片文件
-    all_png_files = sorted(work_dir.glob('*.png'))
-    for png_file in all_png_files:
-        if not png_file.name.endswith('-a.png') and not png_file.name.endswith('-b.png'):
-            other_files.append(png_file)
-    
-    if not a_files and not b_files and not other_files:
-        logger.warning(f"  未找到任何头像文件")
-        return False
-    
-    # 合并所有图片文件（不区分a、b，统一处理）
-    all_avatar_files = []
-    all_avatar_files.extend(a_files)
-    all_avatar_files.extend(b_files)
-    all_avatar_files.extend(other_files)
+    # 查找所有头像文件（-a、-b 和其他非成对的 .png，不区分a、b，统一处理）
+    all_avatar_files = [work_dir / name for name in list_png_names(work_dir)]
     
     if not all_avatar_files:
         logger.warning(f"  未找到任何头像文件")
@@ -379,19 +450,21 @@ def process_single_avatars(work_dir: Path, back_img: Image.Image) -> bool:
     # 创建结果目录
     result_dir.mkdir(parents=True, exist_ok=True)
     
+    # 展示页方形头像边长为画布宽度的70%，画布宽度不超过底图宽度
+    avatar_size = int(back_img.width * 0.7)
+
+    # 展示页底图画布只依赖底图，同一目录内只缩放一次
+    display_back = prepare_display_back(back_img)
+
     success_count = 0
     # 统一处理所有头像文件，不区分a、b，只做单图处理，圆形图片都放在右下角
     for avatar_file in sorted(all_avatar_files):
         try:
-            # 打开头像图片
-            avatar_img = Image.open(avatar_file)
-            
-            # 确保图片是 RGB 或 RGBA 模式
-            if avatar_img.mode not in ('RGB', 'RGBA'):
-                avatar_img = avatar_img.convert('RGBA')
+            # 打开头像图片（JPEG 只解码到展示页方形头像所需的分辨率）
+            avatar_img = open_avatar(avatar_file, avatar_size)
             
             # 创建展示页面：方形和圆形都用同一张图，圆形图片放在右下角
-            display_img = create_single_avatar_display(avatar_img, back_img, circle_position='right')
+            display_img = create_single_avatar_display(avatar_img, back_img, circle_position='right', precomputed_back=display_back)
             
             # 生成输出文件名（使用原文件名，改为.jpg）
             output_name = avatar_file.stem + '.jpg'
@@ -410,6 +483,80 @@ def process_single_avatars(work_dir: Path, back_img: Image.Image) -> bool:
     return success_count > 0
 
 
+def load_back_image(back_image_path: Path) -> Image.Image:
+    """
+    打开并解码底图（RGB、RGBA 保持原始模式，透明通道在各拼图函数中处理；其余模式转换为RGBA）
+
+    Args:
+        back_image_path: 底图路径
+
+    Returns:
+        已加载像素的底图
+    """
+    back_img = Image.open(back_image_path)
+    logger.info(f"底图尺寸: {back_img.size[0]}x{back_img.size[1]}, 模式: {back_img.mode}")
+    if back_img.mode not in ('RGB', 'RGBA'):
+        return back_img.convert('RGBA')
+    back_img.load()
+    return back_img
+
+
+def _init_worker(shm_name: str, back_mode: str, back_size: Tuple[int, int]) -> None:
+    """
+    工作进程初始化：直接映射主进程放在共享内存中的底图像素，既不重复解码也不复制
+
+    像素按每像素4字节（RGBX 或 RGBA）存放，Image.frombuffer 才能零拷贝映射；映射得到的图片只读，
+    拼图时 prepare_couple_back / prepare_display_back 会生成新的 RGB 图片
+
+    Args:
+        shm_name: 共享内存块名称
+        back_mode: 共享内存中的像素模式（RGBX 或 RGBA）
+        back_size: 底图尺寸 (width, height)
+    """
+    global _worker_back_shm, _worker_back_img
+    _worker_back_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_back_img = Image.frombuffer(back_mode, back_size, _worker_back_shm.buf, 'raw', back_mode, 0, 1)
+
+
+def _process_directory_worker(work_dir: Path) -> bool:
+    """
+    工作进程任务：使用进程内缓存的底图处理单个目录的情侣头像拼图
+    """
+    return process_directory(work_dir, _worker_back_img)
+
+
+def _process_single_avatars_worker(work_dir: Path) -> bool:
+    """
+    工作进程任务：使用进程内缓存的底图处理单个目录的单个头像展示
+    """
+    return process_single_avatars(work_dir, _worker_back_img)
+
+
+def _run_parallel(executor: ProcessPoolExecutor, worker: Callable[[Path], bool], subdirs: List[Path], error_message: str) -> int:
+    """
+    将每个子目录提交到进程池处理
+
+    Args:
+        executor: 进程池
+        worker: 工作进程任务函数
+        subdirs: 子目录列表
+        error_message: 出错时的日志前缀
+
+    Returns:
+        成功的目录数量
+    """
+    success_count = 0
+    futures = {executor.submit(worker, subdir): subdir for subdir in subdirs}
+    for future in as_completed(futures):
+        subdir = futures[future]
+        try:
+            if future.result():
+                success_count += 1
+        except Exception as e:
+            logger.error(f"{error_message} {subdir.name} 时发生错误: {e}")
+    return success_count
+
+
 def main():
     """
     主函数
@@ -419,15 +566,17 @@ def main():
         logger.error(f"底图不存在: {BACK_IMAGE}")
         sys.exit(1)
     
-    # 打开底图
+    # 打开底图（只在主进程解码一次，通过共享内存交给各工作进程）
+    # 保持底图的原始模式（RGBA或RGB），不进行转换
+    # 因为back.png是透明图片，需要在create_couple_puzzle中正确处理
     try:
-        back_img = Image.open(BACK_IMAGE)
-        # 保持底图的原始模式（RGBA或RGB），不进行转换
-        # 因为back.png是透明图片，需要在create_couple_puzzle中正确处理
-        logger.info(f"底图尺寸: {back_img.size[0]}x{back_img.size[1]}, 模式: {back_img.mode}")
+        back_img = load_back_image(BACK_IMAGE)
+        back_size = back_img.size
     except Exception as e:
         logger.error(f"打开底图失败: {e}")
         sys.exit(1)
+
+    log_jpeg_encoder()
     
     # 检查 imgs 目录
     if not IMGS_DIR.exists():
@@ -435,41 +584,49 @@ def main():
         sys.exit(1)
     
     # 遍历所有子目录（排除结果目录）
-    subdirs = [d for d in IMGS_DIR.iterdir() if d.is_dir() and not d.name.endswith('-a-result') and not d.name.endswith(f'-{RESULT_DIR_NAME_SINGLE}')]
+    # scandir 的目录项自带文件类型，is_dir() 不需要额外的 stat
+    with os.scandir(IMGS_DIR) as entries:
+        subdirs = [
+            Path(entry.path) for entry in entries
+            if entry.is_dir() and not entry.name.endswith('-a-result') and not entry.name.endswith(f'-{RESULT_DIR_NAME_SINGLE}')
+        ]
     
     if not subdirs:
         logger.warning("未找到任何子目录")
         return
     
     logger.info(f"找到 {len(subdirs)} 个子目录")
-    
-    # 处理情侣头像拼图
-    logger.info("=" * 50)
-    logger.info("处理情侣头像拼图")
-    logger.info("=" * 50)
-    success_count = 0
-    for subdir in subdirs:
-        try:
-            if process_directory(subdir, back_img):
-                success_count += 1
-        except Exception as e:
-            logger.error(f"处理目录 {subdir.name} 时发生错误: {e}")
-    
-    logger.info(f"情侣头像拼图处理完成: {success_count}/{len(subdirs)} 个目录成功")
-    
-    # 处理单个头像展示（使用back.png作为底图）
-    logger.info("=" * 50)
-    logger.info("处理单个头像展示")
-    logger.info("=" * 50)
-    single_success_count = 0
-    for subdir in subdirs:
-        try:
-            if process_single_avatars(subdir, back_img):
-                single_success_count += 1
-        except Exception as e:
-            logger.error(f"处理单个头像 {subdir.name} 时发生错误: {e}")
-    
-    logger.info(f"单个头像展示处理完成: {single_success_count}/{len(subdirs)} 个目录成功")
+
+    # 各目录相互独立，两类任务共用一个进程池（底图只解码一次，像素通过共享内存交给各进程）
+    max_workers = min(max(1, (os.cpu_count() or 1) // THREADS_PER_WORKER), len(subdirs))
+    # RGB 底图按 RGBX 放入共享内存（RGBA 本身即每像素4字节），各工作进程直接映射，不再各持一份副本
+    back_mode = 'RGBX' if back_img.mode == 'RGB' else 'RGBA'
+    back_bytes = back_img.convert(back_mode).tobytes()
+    back_shm = shared_memory.SharedMemory(create=True, size=len(back_bytes))
+    try:
+        back_shm.buf[:len(back_bytes)] = back_bytes
+        del back_bytes, back_img
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(back_shm.name, back_mode, back_size)
+        ) as executor:
+            # 处理情侣头像拼图
+            logger.info("=" * 50)
+            logger.info("处理情侣头像拼图")
+            logger.info("=" * 50)
+            success_count = _run_parallel(executor, _process_directory_worker, subdirs, "处理目录")
+            logger.info(f"情侣头像拼图处理完成: {success_count}/{len(subdirs)} 个目录成功")
+
+            # 处理单个头像展示（使用back.png作为底图）
+            logger.info("=" * 50)
+            logger.info("处理单个头像展示")
+            logger.info("=" * 50)
+            single_success_count = _run_parallel(executor, _process_single_avatars_worker, subdirs, "处理单个头像")
+            logger.info(f"单个头像展示处理完成: {single_success_count}/{len(subdirs)} 个目录成功")
+    finally:
+        back_shm.close()
+        back_shm.unlink()
 
 
 if __name__ == '__main__':
@@ -5,12 +5,21 @@
 包含拼图处理所需的公共工具函数
 """
 
+import io
 import logging
+import threading
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, Tuple
-from PIL import Image, ImageFilter, ImageDraw, ImageEnhance
+from PIL import Image, ImageFilter, ImageDraw, ImageEnhance, features
 import numpy as np
 
+# cykooz.resizer 为可选依赖（Rust SIMD 实现，会自动选择 AVX2/SSE4.1 指令集），未安装时回退到 Pillow
+try:
+    from cykooz_resizer import FilterType, ResizeAlg, ResizeOptions, Resizer
+except ImportError:
+    Resizer = None
+
 logger = logging.getLogger(__name__)
 
 # 常量定义
@@ -20,21 +29,62 @@ BACK1_IMAGE = Path(__file__).parent / 'back1.png'
 # 输出图片配置
 FINAL_PUZZLE_MIN_SIZE = 200 * 1024  # 200KB（最终拼图结果最小大小）
 FINAL_PUZZLE_MAX_SIZE = 300 * 1024  # 300KB（最终拼图结果最大大小）
+JPEG_SUBSAMPLING = 2  # 4:2:0 色度抽样（编码数据量最小）
 BORDER_RADIUS = 25  # 圆角半径
 SHADOW_OFFSET = (5, 5)
 SHADOW_BLUR = 10
+BACKGROUND_BLUR_SCALE = 4  # 磨玻璃背景模糊前的缩小倍数
+
+# Lanczos3 缩放器（每个线程复用一个实例，Resizer 内部缓冲区不能在线程间共享）
+_resizer_local = threading.local()
+if Resizer is not None:
+    _RESIZE_OPTIONS = ResizeOptions(resize_alg=ResizeAlg.convolution(FilterType.lanczos3))
+
+
+def _get_resizer() -> Optional['Resizer']:
+    """
+    获取当前线程的 Lanczos3 缩放器，未安装 cykooz.resizer 时返回 None
+    """
+    if Resizer is None:
+        return None
+    resizer = getattr(_resizer_local, 'resizer', None)
+    if resizer is None:
+        resizer = _resizer_local.resizer = Resizer()
+    return resizer
+
+
+def resize_lanczos(image: Image.Image, size: Tuple[int, int], reducing_gap: Optional[float] = None) -> Image.Image:
+    """
+    使用 Lanczos3 算法缩放图片，优先使用 cykooz.resizer，未安装时回退到 Pillow
+
+    Args:
+        image: 原始图片（RGB 或 RGBA）
+        size: 目标尺寸 (width, height)
+        reducing_gap: 回退到 Pillow 时使用，先按整数倍快速缩小到目标尺寸的 reducing_gap 倍再做 Lanczos
+
+    Returns:
+        缩放后的图片（与原图模式相同）
+    """
+    resizer = _get_resizer()
+    if resizer is None:
+        return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
 
+    dst = Image.new(image.mode, size)
+    resizer.resize_pil(image, dst, _RESIZE_OPTIONS)
+    return dst
 
+
+@lru_cache(maxsize=64)
 def create_rounded_rectangle_mask(size: Tuple[int, int], radius: int) -> Image.Image:
     """
-    创建圆角矩形遮罩
+    创建圆角矩形遮罩（按尺寸和半径缓存，同一批头像缩放后尺寸基本相同）
 
     Args:
         size: 图片尺寸 (width, height)
         radius: 圆角半径
 
     Returns:
-        遮罩图片
+        遮罩图片（缓存共享，调用方只能读取，不能修改）
     """
     mask = Image.new('L', size, 0)
     draw = ImageDraw.Draw(mask)
@@ -49,52 +99,85 @@ def create_rounded_rectangle_mask(size: Tuple[int, int], radius: int) -> Image.I
     return mask
 
 
-def add_shadow_and_rounded_corners(image: Image.Image, radius: int = BORDER_RADIUS) -> Image.Image:
+@lru_cache(maxsize=64)
+def _blurred_shadow(width: int, height: int, radius: int) -> Image.Image:
     """
-    为图片添加阴影和圆角效果
+    生成模糊后的阴影层（尺寸为图片加上两侧阴影边距，按尺寸和半径缓存）
+
+    阴影是纯黑色，只需对单通道做模糊（RGBA 画布的数据量是4倍）；
+    圆角矩形的阴影只在边缘附近变化，中间部分每行（列）都相同，
+    因此只模糊一个小圆角矩形，再重复其中间行（列）展开到目标尺寸，结果与直接模糊完全一致
 
     Args:
-        image: 原始图片
+        width: 图片宽度
+        height: 图片高度
         radius: 圆角半径
 
     Returns:
-        处理后的图片
+        阴影层（RGBA模式，黑色，缓存共享，调用方需复制后再修改）
     """
-    # 创建带阴影的画布（增加边距以容纳阴影）
     shadow_margin = max(SHADOW_OFFSET) + SHADOW_BLUR
-    canvas_size = (
-        image.width + shadow_margin * 2,
-        image.height + shadow_margin * 2
-    )
-
-    # 创建阴影层
-    shadow = Image.new('RGBA', canvas_size, (0, 0, 0, 0))
-    shadow_draw = ImageDraw.Draw(shadow)
-
-    # 绘制阴影（使用半透明黑色）
-    shadow_rect = [
-        (shadow_margin + SHADOW_OFFSET[0], shadow_margin + SHADOW_OFFSET[1]),
-        (shadow_margin + image.width + SHADOW_OFFSET[0], shadow_margin + image.height + SHADOW_OFFSET[1])
-    ]
-    shadow_draw.rounded_rectangle(
-        shadow_rect,
+    edge = radius + SHADOW_BLUR * 4 + 2
+    small_width = min(width, edge * 2)
+    small_height = min(height, edge * 2)
+
+    def stretch_index(small_len: int, full_len: int, offset: int) -> np.ndarray:
+        mid = shadow_margin + offset + small_len // 2
+        return np.concatenate([
+            np.arange(mid),
+            np.full(full_len - small_len, mid),
+            np.arange(mid, small_len + shadow_margin * 2)
+        ])
+
+    # 绘制阴影（透明度100的圆角矩形）
+    shadow = Image.new('L', (small_width + shadow_margin * 2, small_height + shadow_margin * 2), 0)
+    ImageDraw.Draw(shadow).rounded_rectangle(
+        [
+            (shadow_margin + SHADOW_OFFSET[0], shadow_margin + SHADOW_OFFSET[1]),
+            (shadow_margin + small_width + SHADOW_OFFSET[0], shadow_margin + small_height + SHADOW_OFFSET[1])
+        ],
         radius=radius,
-        fill=(0, 0, 0, 100)
+        fill=100
     )
 
     # 模糊阴影
     shadow = shadow.filter(ImageFilter.GaussianBlur(radius=SHADOW_BLUR))
+    if (small_width, small_height) != (width, height):
+        rows = stretch_index(small_height, height, SHADOW_OFFSET[1])
+        cols = stretch_index(small_width, width, SHADOW_OFFSET[0])
+        shadow = Image.fromarray(np.asarray(shadow)[np.ix_(rows, cols)], 'L')
+
+    layer = Image.new('RGBA', shadow.size, (0, 0, 0, 0))
+    layer.putalpha(shadow)
+    return layer
+
+
+def add_shadow_and_rounded_corners(image: Image.Image, radius: int = BORDER_RADIUS) -> Image.Image:
+    """
+    为图片添加阴影和圆角效果
+
+    Args:
+        image: 原始图片
+        radius: 圆角半径
+
+    Returns:
+        处理后的图片
+    """
+    # 阴影边距
+    shadow_margin = max(SHADOW_OFFSET) + SHADOW_BLUR
+
+    # 创建带阴影的画布（复制缓存的模糊阴影层，结果会被修改）
+    shadow = _blurred_shadow(image.width, image.height, radius).copy()
 
     # 创建圆角遮罩
     mask = create_rounded_rectangle_mask(image.size, radius)
 
-    # 如果原图有透明通道，应用遮罩
-    if image.mode == 'RGBA':
+    # 应用遮罩（RGB 图片复制后直接 putalpha，比先 convert('RGBA') 少一次整图转换）
+    if image.mode in ('RGB', 'RGBA'):
         image = image.copy()
-        image.putalpha(mask)
     else:
         image = image.convert('RGBA')
-        image.putalpha(mask)
+    image.putalpha(mask)
 
     # 将图片粘贴到阴影层上
     shadow.paste(image, (shadow_margin, shadow_margin), image)
@@ -150,15 +233,8 @@ def add_border(image: Image.Image, border_width: int = 12, border_color: Tuple[i
     )
 
     # 应用遮罩到canvas的alpha通道，使内部区域透明
-    canvas_alpha = canvas.split()[3]
-    # 将遮罩应用到alpha通道（反转，使内部透明）
-    new_alpha = Image.new('L', canvas_size, 255)
-    # 内部区域（遮罩为0的地方）设为透明
-    alpha_array = np.array(canvas_alpha)
-    mask_array = np.array(inner_mask)
-    alpha_array[mask_array == 0] = 0
-    new_alpha = Image.fromarray(alpha_array)
-    canvas.putalpha(new_alpha)
+    # 画布以不透明的边框色填充，alpha 通道全为255，内部区域（遮罩为0的地方）设为透明后即等于遮罩本身
+    canvas.putalpha(inner_mask)
 
     # 将原图粘贴到画布中心
     canvas.paste(image, (border_width, border_width), image)
@@ -166,10 +242,114 @@ def add_border(image: Image.Image, border_width: int = 12, border_color: Tuple[i
     return canvas
 
 
+def log_jpeg_encoder() -> None:
+    """
+    记录当前 Pillow 使用的 JPEG 编码库，便于确认是否启用了 libjpeg-turbo 的 SIMD 加速
+    """
+    if features.check_feature('libjpeg_turbo'):
+        logger.info(f"JPEG 编码库: libjpeg-turbo {features.version_feature('libjpeg_turbo')}")
+    else:
+        logger.warning(f"JPEG 编码库: libjpeg {features.version('jpg')}（未使用 libjpeg-turbo，编码速度较慢）")
+
+
+def flatten_to_rgb(image: Image.Image) -> Image.Image:
+    """
+    将图片转换为RGB模式（透明部分使用白色背景）
+
+    Args:
+        image: 原始图片
+
+    Returns:
+        RGB模式的图片（原图已是RGB时直接返回原图，不复制）
+    """
+    if image.mode == 'RGBA':
+        bg = Image.new('RGB', image.size, (255, 255, 255))
+        bg.paste(image, mask=image)  # RGBA 图片直接作为遮罩（使用其透明通道）
+        return bg
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+def _encode_jpeg(image: Image.Image, quality: int, optimize: bool = False) -> bytes:
+    """
+    在内存中编码 JPEG，不写磁盘
+
+    Args:
+        image: RGB 图片
+        quality: JPEG 质量
+        optimize: 是否优化霍夫曼表（更慢，文件略小）
+
+    Returns:
+        JPEG 数据
+    """
+    buf = io.BytesIO()
+    image.save(buf, 'JPEG', quality=quality, optimize=optimize, subsampling=JPEG_SUBSAMPLING)
+    return buf.getvalue()
+
+
+def _search_jpeg_quality(
+    image: Image.Image,
+    min_size: int,
+    max_size: int,
+    target_size: int,
+    min_quality: int = 30,
+    max_quality: int = 95,
+    first_quality: Optional[int] = None
+) -> Tuple[int, bytes, bool]:
+    """
+    二分查找 JPEG 质量，使文件大小落在 [min_size, max_size] 之间
+
+    文件大小随质量单调增加：偏大时降低质量，偏小或已在范围内时提高质量，最终返回范围内的最高质量。
+    试探时即使用 optimize=True 编码，按最终写入的文件大小判断是否落在范围内；
+    指定 first_quality 时先试探该质量，再在剩余区间内二分
+
+    Args:
+        image: RGB 图片
+        min_size: 最小文件大小（字节）
+        max_size: 最大文件大小（字节）
+        target_size: 目标文件大小（字节），未命中范围时取最接近它的结果
+        min_quality: 最低质量
+        max_quality: 最高质量
+        first_quality: 首次试探的质量（可选）
+
+    Returns:
+        (质量, JPEG 数据, 是否落在范围内)
+    """
+    in_range_quality, in_range_data = max_quality, b''
+    best_quality, best_data = max_quality, b''
+    lo, hi = min_quality, max_quality
+    while lo <= hi:
+        if first_quality is not None and lo <= first_quality <= hi:
+            quality, first_quality = first_quality, None
+        else:
+            quality = (lo + hi) // 2
+        data = _encode_jpeg(image, quality, optimize=True)
+        size = len(data)
+
+        if min_size <= size <= max_size:
+            # 命中范围后继续向上查找，保留范围内的最高质量
+            in_range_quality, in_range_data = quality, data
+        elif not best_data or abs(size - target_size) < abs(len(best_data) - target_size):
+            # 记录最接近目标大小的质量
+            best_quality, best_data = quality, data
+
+        if size > max_size:
+            hi = quality - 1
+        else:
+            lo = quality + 1
+
+    if in_range_data:
+        return in_range_quality, in_range_data, True
+    return best_quality, best_data, False
+
+
 def save_final_puzzle_image(image: Image.Image, output_file: Path, target_size: int = 250 * 1024) -> None:
     """
     保存最终拼图结果图片，统一压缩到200-300KB之间
 
+    质量搜索全部在内存中完成（二分查找，找出落在范围内的最高质量），最终只写一次磁盘
+
     Args:
         image: 图片对象
         output_file: 输出文件路径
@@ -184,81 +364,32 @@ def save_final_puzzle_image(image: Image.Image, output_file: Path, target_size:
         target_size = max_size
 
     # 确保图片是 RGB 模式（JPEG 不支持透明通道）
-    if image.mode == 'RGBA':
-        bg = Image.new('RGB', image.size, (255, 255, 255))
-        bg.paste(image, mask=image.split()[3])
-        image = bg
-    elif image.mode != 'RGB':
-        image = image.convert('RGB')
+    image = flatten_to_rgb(image)
 
     # 如果输出文件是PNG，改为JPG
     if output_file.suffix.lower() == '.png':
         output_file = output_file.with_suffix('.jpg')
 
-    # 先尝试高质量保存，检查文件大小
-    current_quality = 95
-    best_quality = current_quality
-    best_size = 0
-
-    # 从高质量开始逐步降低，找到最接近目标大小的质量
-    while current_quality >= 30:
-        image.save(output_file, 'JPEG', quality=current_quality, optimize=True)
-        file_size = output_file.stat().st_size
-
-        # 如果文件大小在目标范围内，直接返回
-        if min_size <= file_size <= max_size:
-            logger.info(f"  已保存最终拼图结果，质量: {current_quality}，大小: {file_size / 1024:.2f}KB")
-            return
-
-        # 记录最接近目标大小的质量
-        if best_size == 0 or abs(file_size - target_size) < abs(best_size - target_size):
-            best_quality = current_quality
-            best_size = file_size
-
-        # 如果文件太大，继续降低质量
-        if file_size > max_size:
-            current_quality -= 5
-        # 如果文件太小，需要提高质量（但我们已经从高到低，所以这种情况不应该发生）
-        else:
-            break
+    quality, data, in_range = _search_jpeg_quality(image, min_size, max_size, target_size, first_quality=90)
+    resized = False
 
-    # 如果找到的质量对应的文件大小不在范围内，需要调整
-    if best_size > max_size:
-        # 文件太大，需要缩小尺寸
+    if not in_range and len(data) > max_size:
+        # 最低质量仍然太大，需要缩小尺寸
         # 计算缩放比例，使文件大小接近目标大小
-        scale = (target_size / best_size) ** 0.5
+        scale = (target_size / len(data)) ** 0.5
         new_size = (int(image.width * scale), int(image.height * scale))
-        resized_image = image.resize(new_size, Image.Resampling.LANCZOS)
-
-        # 重新尝试保存，从较高质量开始
-        current_quality = 85
-        while current_quality >= 30:
-            resized_image.save(output_file, 'JPEG', quality=current_quality, optimize=True)
-            file_size = output_file.stat().st_size
-
-            if min_size <= file_size <= max_size:
-                logger.info(f"  已缩小尺寸并保存最终拼图结果，质量: {current_quality}，大小: {file_size / 1024:.2f}KB")
-                return
-
-            if file_size > max_size:
-                current_quality -= 5
-            else:
-                # 文件太小，使用当前质量即可
-                logger.info(f"  已缩小尺寸并保存最终拼图结果，质量: {current_quality}，大小: {file_size / 1024:.2f}KB")
-                return
-
-        # 如果还是太大，使用最低质量
-        resized_image.save(output_file, 'JPEG', quality=30, optimize=True)
-        file_size = output_file.stat().st_size
-        logger.info(f"  已缩小尺寸并保存最终拼图结果（最低质量），大小: {file_size / 1024:.2f}KB")
-    elif best_size < min_size:
-        # 文件太小，使用最佳质量即可（这种情况很少见）
-        image.save(output_file, 'JPEG', quality=best_quality, optimize=True)
-        logger.info(f"  已保存最终拼图结果，质量: {best_quality}，大小: {best_size / 1024:.2f}KB")
+        image = image.resize(new_size, Image.Resampling.LANCZOS)
+        resized = True
+
+        # 重新搜索，最高从85开始
+        quality, data, in_range = _search_jpeg_quality(image, min_size, max_size, target_size, max_quality=85)
+
+    output_file.write_bytes(data)
+    file_size = len(data)
+    if resized:
+        logger.info(f"  已缩小尺寸并保存最终拼图结果，质量: {quality}，大小: {file_size / 1024:.2f}KB")
     else:
-        # 使用最佳质量
-        image.save(output_file, 'JPEG', quality=best_quality, optimize=True)
-        logger.info(f"  已保存最终拼图结果，质量: {best_quality}，大小: {best_size / 1024:.2f}KB")
+        logger.info(f"  已保存最终拼图结果，质量: {quality}，大小: {file_size / 1024:.2f}KB")
 
 
 def overlay_images(base: Image.Image, overlay: Image.Image) -> Image.Image:
@@ -276,6 +407,10 @@ def overlay_images(base: Image.Image, overlay: Image.Image) -> Image.Image:
     if base.size != overlay.size:
         overlay = overlay.resize(base.size, Image.Resampling.LANCZOS)
 
+    # 覆盖图没有透明通道时叠加结果就是覆盖图本身，无需逐像素混合
+    if overlay.mode in ('RGB', 'L') and 'transparency' not in overlay.info:
+        return overlay.convert('RGBA')
+
     # 如果底图没有透明通道，转换为 RGBA
     if base.mode != 'RGBA':
         base = base.convert('RGBA')
@@ -303,22 +438,9 @@ def create_couple_background(img_a: Image.Image, img_b: Image.Image, back_img: I
     Returns:
         处理后的背景底图
     """
-    # 确保两张图片是RGB模式（去除透明通道）
-    if img_a.mode == 'RGBA':
-        # 如果有透明通道，先转换为RGB（使用白色背景）
-        bg_a = Image.new('RGB', img_a.size, (255, 255, 255))
-        bg_a.paste(img_a, mask=img_a.split()[3])
-        img_a = bg_a
-    elif img_a.mode != 'RGB':
-        img_a = img_a.convert('RGB')
-
-    if img_b.mode == 'RGBA':
-        # 如果有透明通道，先转换为RGB（使用白色背景）
-        bg_b = Image.new('RGB', img_b.size, (255, 255, 255))
-        bg_b.paste(img_b, mask=img_b.split()[3])
-        img_b = bg_b
-    elif img_b.mode != 'RGB':
-        img_b = img_b.convert('RGB')
+    # 确保两张图片是RGB模式（去除透明通道，使用白色背景）
+    img_a = flatten_to_rgb(img_a)
+    img_b = flatten_to_rgb(img_b)
 
     # 确保两张图片高度一致（以较小的为准）
     min_height = min(img_a.height, img_b.height)
@@ -349,11 +471,17 @@ def create_couple_background(img_a: Image.Image, img_b: Image.Image, back_img: I
         crop_top = (stitched_img.height - crop_height) // 2
         cropped_img = stitched_img.crop((0, crop_top, stitched_img.width, crop_top + crop_height))
 
-    # 调整到目标尺寸
-    cropped_img = cropped_img.resize(target_size, Image.Resampling.LANCZOS)
-
     # 添加磨玻璃效果（高斯模糊，radius=20，减弱效果）
-    blurred_img = cropped_img.filter(ImageFilter.GaussianBlur(radius=20))
+    # 模糊后只剩低频内容，先缩小到目标尺寸的 1/BACKGROUND_BLUR_SCALE 再按比例缩小半径模糊，
+    # 最后双线性放大回目标尺寸，与直接在目标尺寸上模糊肉眼无差别，计算量小得多
+    small_size = (
+        max(1, target_size[0] // BACKGROUND_BLUR_SCALE),
+        max(1, target_size[1] // BACKGROUND_BLUR_SCALE)
+    )
+    # 缩小后马上做重度模糊，Lanczos 保留的高频细节会被模糊掉，使用更便宜的双线性缩放
+    small_img = cropped_img.resize(small_size, Image.Resampling.BILINEAR)
+    small_img = small_img.filter(ImageFilter.GaussianBlur(radius=20 / BACKGROUND_BLUR_SCALE))
+    blurred_img = small_img.resize(target_size, Image.Resampling.BILINEAR)
 
     # 确保磨玻璃图片是RGB模式
     if blurred_img.mode != 'RGB':
@@ -383,6 +511,23 @@ def create_couple_background(img_a: Image.Image, img_b: Image.Image, back_img: I
     return result
 
 
+@lru_cache(maxsize=16)
+def _circle_mask(size: int) -> Image.Image:
+    """
+    创建圆形遮罩（按边长缓存）
+
+    Args:
+        size: 遮罩边长
+
+    Returns:
+        遮罩图片（缓存共享，调用方只能读取，不能修改）
+    """
+    mask = Image.new('L', (size, size), 0)
+    draw = ImageDraw.Draw(mask)
+    draw.ellipse([(0, 0), (size, size)], fill=255)
+    return mask
+
+
 def create_circular_image(image: Image.Image, border_width: int = 8, outer_border_width: int = 3) -> Image.Image:
     """
     创建圆形图片，带白色边框和白灰色外边框
@@ -404,17 +549,14 @@ def create_circular_image(image: Image.Image, border_width: int = 8, outer_borde
         image = image.crop((left, top, left + size, top + size))
 
     # 创建圆形遮罩
-    mask = Image.new('L', (size, size), 0)
-    draw = ImageDraw.Draw(mask)
-    draw.ellipse([(0, 0), (size, size)], fill=255)
+    mask = _circle_mask(size)
 
     # 应用圆形遮罩
-    if image.mode == 'RGBA':
+    if image.mode in ('RGB', 'RGBA'):
         image = image.copy()
-        image.putalpha(mask)
     else:
         image = image.convert('RGBA')
-        image.putalpha(mask)
+    image.putalpha(mask)
 
     # 创建带边框的画布（增加内边框和外边框宽度）
     canvas_size = size + border_width * 2 + outer_border_width * 2
@@ -437,19 +579,10 @@ def create_circular_image(image: Image.Image, border_width: int = 8, outer_borde
         fill=(255, 255, 255, 255)
     )
 
-    # 创建内部圆形遮罩（用于裁剪图片）
-    inner_mask = Image.new('L', (size, size), 0)
-    inner_draw = ImageDraw.Draw(inner_mask)
-    inner_draw.ellipse([(0, 0), (size, size)], fill=255)
-
-    # 应用内部遮罩到图片
-    inner_image = image.copy()
-    inner_image.putalpha(inner_mask)
-
-    # 将图片粘贴到画布中心（考虑外边框和内边框）
+    # 将图片粘贴到画布中心（考虑外边框和内边框；图片的透明通道已是圆形遮罩）
     paste_x = outer_border_width + border_width
     paste_y = outer_border_width + border_width
-    canvas.paste(inner_image, (paste_x, paste_y), inner_image)
+    canvas.paste(image, (paste_x, paste_y), image)
 
     return canvas
 
@@ -477,11 +610,10 @@ def create_rounded_square_image(image: Image.Image, radius: int = 30) -> Image.I
     mask = create_rounded_rectangle_mask((size, size), radius)
 
     # 应用圆角遮罩
-    if image.mode == 'RGBA':
+    if image.mode in ('RGB', 'RGBA'):
         image = image.copy()
-        image.putalpha(mask)
     else:
         image = image.convert('RGBA')
-        image.putalpha(mask)
+    image.putalpha(mask)
 
     return image
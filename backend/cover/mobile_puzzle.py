@@ -112,23 +112,12 @@ def prepare_mobile_desktop(work_dir: Path, source_dir: Path = None) -> bool:
 
         # 确保两张图片都是 9:19 比例
         base_ratio = base_img.width / base_img.height
-        cover_ratio = cover_img.width / cover_img.height
         target_ratio = 9 / 19
 
         # 调整底图尺寸：如果原图不是 9:19，则以中心和高度为基础，裁剪宽度将其调整为 9:19
         if abs(base_ratio - target_ratio) > 0.01:
             base_img = crop_to_ratio_center_height(base_img, target_ratio)
 
-        # 调整覆盖图尺寸
-        if abs(cover_ratio - target_ratio) > 0.01:
-            new_height = cover_img.height
-            new_width = int(new_height * target_ratio)
-            cover_img = cover_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-        # 确保两张图片尺寸一致
-        if base_img.size != cover_img.size:
-            cover_img = cover_img.resize(base_img.size, Image.Resampling.LANCZOS)
-
         result = overlay_images(base_img, cover_img)
         result.save(mobile_desktop, 'PNG')
         logger.info(f"  已生成 mobile-desktop.png")
@@ -275,23 +264,12 @@ def prepare_mobile_desktop_2(work_dir: Path, source_dir: Path = None) -> bool:
         
         # 确保两张图片都是 9:19 比例
         base_ratio = base_img.width / base_img.height
-        cover_ratio = cover_img.width / cover_img.height
         target_ratio = 9 / 19
 
         # 调整底图尺寸：如果原图不是 9:19，则以中心和高度为基础，裁剪宽度将其调整为 9:19
         if abs(base_ratio - target_ratio) > 0.01:
             base_img = crop_to_ratio_center_height(base_img, target_ratio)
 
-        # 调整覆盖图尺寸
-        if abs(cover_ratio - target_ratio) > 0.01:
-            new_height = cover_img.height
-            new_width = int(new_height * target_ratio)
-            cover_img = cover_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-        # 确保两张图片尺寸一致
-        if base_img.size != cover_img.size:
-            cover_img = cover_img.resize(base_img.size, Image.Resampling.LANCZOS)
-
         # 对底图进行磨玻璃模糊效果（高斯模糊，加大模糊半径以增强效果）
         blurred_img = base_img.filter(ImageFilter.GaussianBlur(radius=140))
 
@@ -453,7 +431,6 @@ def prepare_mobile_desktop_3(work_dir: Path, source_dir: Path = None) -> bool:
         
         # 确保两张图片都是 9:19 比例
         base_ratio = base_img.width / base_img.height
-        cover_ratio = cover_img.width / cover_img.height
         target_ratio = 9 / 19
 
         # 调整底图尺寸
@@ -462,16 +439,6 @@ def prepare_mobile_desktop_3(work_dir: Path, source_dir: Path = None) -> bool:
             new_width = int(new_height * target_ratio)
             base_img = base_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
 
-        # 调整覆盖图尺寸
-        if abs(cover_ratio - target_ratio) > 0.01:
-            new_height = cover_img.height
-            new_width = int(new_height * target_ratio)
-            cover_img = cover_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-        # 确保两张图片尺寸一致
-        if base_img.size != cover_img.size:
-            cover_img = cover_img.resize(base_img.size, Image.Resampling.LANCZOS)
-
         # 对底图进行磨玻璃模糊效果（高斯模糊，参照 mobile.png 的处理效果，radius=140）
         blurred_img = base_img.filter(ImageFilter.GaussianBlur(radius=140))
 
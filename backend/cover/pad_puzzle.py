@@ -80,7 +80,6 @@ def prepare_pad_images(work_dir: Path, source_dir: Path = None) -> bool:
                 # 确保两张图片都是 4:3 比例
                 target_ratio = 4 / 3
                 base_ratio = base_img.width / base_img.height
-                cover_ratio = cover_img.width / cover_img.height
                 
                 # 调整底图尺寸
                 if abs(base_ratio - target_ratio) > 0.01:
@@ -88,16 +87,6 @@ def prepare_pad_images(work_dir: Path, source_dir: Path = None) -> bool:
                     new_width = int(new_height * target_ratio)
                     base_img = base_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
                 
-                # 调整覆盖图尺寸
-                if abs(cover_ratio - target_ratio) > 0.01:
-                    new_height = cover_img.height
-                    new_width = int(new_height * target_ratio)
-                    cover_img = cover_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                
-                # 确保两张图片尺寸一致
-                if base_img.size != cover_img.size:
-                    cover_img = cover_img.resize(base_img.size, Image.Resampling.LANCZOS)
-                
                 result = overlay_images(base_img, cover_img)
                 result.save(pad_desktop, 'PNG')
                 logger.info(f"  已生成 pad-desktop.png")
@@ -120,7 +109,6 @@ def prepare_pad_images(work_dir: Path, source_dir: Path = None) -> bool:
                 # 确保两张图片都是 4:3 比例
                 target_ratio = 4 / 3
                 base_ratio = base_img.width / base_img.height
-                cover_ratio = cover_img.width / cover_img.height
                 
                 # 调整底图尺寸
                 if abs(base_ratio - target_ratio) > 0.01:
@@ -128,16 +116,6 @@ def prepare_pad_images(work_dir: Path, source_dir: Path = None) -> bool:
                     new_width = int(new_height * target_ratio)
                     base_img = base_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
                 
-                # 调整覆盖图尺寸
-                if abs(cover_ratio - target_ratio) > 0.01:
-                    new_height = cover_img.height
-                    new_width = int(new_height * target_ratio)
-                    cover_img = cover_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                
-                # 确保两张图片尺寸一致
-                if base_img.size != cover_img.size:
-                    cover_img = cover_img.resize(base_img.size, Image.Resampling.LANCZOS)
-                
                 result = overlay_images(base_img, cover_img)
                 result.save(pad_lock, 'PNG')
                 logger.info(f"  已生成 pad-lock.png")
@@ -5,11 +5,14 @@
 遍历 imgs 目录下的项目目录，对每个子目录中的图片进行处理，结果输出到对应的 *-result 目录。
 """
 
+import os
 import sys
 import argparse
 import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from multiprocessing import shared_memory
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Tuple
 from PIL import Image
 
 try:
@@ -20,7 +23,7 @@ try:
     )
     from .pad_puzzle import prepare_pad_images, create_pad_puzzle
     from .pc_puzzle import prepare_pc_desktop_mac, create_pc_puzzle
-    from .utils import get_image_file, BACK_IMAGE, save_final_puzzle_image, add_shadow_and_rounded_corners, add_size_watermark
+    from .utils import get_image_file, BACK_IMAGE, save_final_puzzle_image, add_shadow_and_rounded_corners, add_size_watermark, resize_lanczos, resolve_main_color, log_jpeg_encoder
     from .phone_screen_replace import replace_screen
 except ImportError:
     from mobile_puzzle import (
@@ -30,7 +33,7 @@ except ImportError:
     )
     from pad_puzzle import prepare_pad_images, create_pad_puzzle
     from pc_puzzle import prepare_pc_desktop_mac, create_pc_puzzle
-    from utils import get_image_file, BACK_IMAGE, save_final_puzzle_image, add_shadow_and_rounded_corners, add_size_watermark
+    from utils import get_image_file, BACK_IMAGE, save_final_puzzle_image, add_shadow_and_rounded_corners, add_size_watermark, resize_lanczos, resolve_main_color, log_jpeg_encoder
     from phone_screen_replace import replace_screen
 
 logging.basicConfig(
@@ -43,6 +46,29 @@ logger = logging.getLogger(__name__)
 IMGS_DIR = Path(__file__).parent / 'imgs'
 MOBILE_IMGS_DIR = Path(__file__).parent / 'mobile-imgs'
 PHONE_TEMPLATE = Path(__file__).parent / 'phone_template.png'
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+THREADS_PER_WORKER = 4  # 每个工作进程内的线程数上限；进程数取 CPU 核数 / 4，避免进程数 × 线程数远超核数
+
+# 工作进程内的底图（由 _init_worker 直接映射主进程放在共享内存中的 RGBX 像素，只读，需持有共享内存对象以保持映射有效）
+_worker_back_shm: Optional[shared_memory.SharedMemory] = None
+_worker_back_img: Optional[Image.Image] = None
+
+
+def list_image_files(dir_path: Path) -> List[Path]:
+    """
+    列出目录下直接存放的图片文件（一次 scandir，扩展名不区分大小写）
+
+    Args:
+        dir_path: 目录
+
+    Returns:
+        按文件名排序的图片路径列表
+    """
+    with os.scandir(dir_path) as entries:
+        return sorted(
+            Path(entry.path) for entry in entries
+            if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file()
+        )
 
 
 def process_subfolder(source_dir: Path, result_dir: Path, main_color: Optional[str] = None) -> bool:
@@ -89,9 +115,11 @@ def process_subfolder(source_dir: Path, result_dir: Path, main_color: Optional[s
         prepare_mobile_desktop_3(result_dir, source_dir=source_dir)
 
         if mobile_lock_file:
-            success &= create_mobile_puzzle(result_dir, result_dir, main_color, source_dir=source_dir)
-            success &= create_mobile_puzzle_2(result_dir, result_dir, main_color, source_dir=source_dir)
-            success &= create_mobile_puzzle_3(result_dir, result_dir, main_color, source_dir=source_dir)
+            # 三张 Mobile 拼图都从 mobile-lock 提取主色调，只提取一次
+            mobile_main_color = resolve_main_color(main_color, mobile_lock_file)
+            success &= create_mobile_puzzle(result_dir, result_dir, mobile_main_color, source_dir=source_dir)
+            success &= create_mobile_puzzle_2(result_dir, result_dir, mobile_main_color, source_dir=source_dir)
+            success &= create_mobile_puzzle_3(result_dir, result_dir, mobile_main_color, source_dir=source_dir)
 
     # 3. pc.png → PC 预处理 + 拼图
     pc_file = get_image_file(source_dir, 'pc')
@@ -125,12 +153,7 @@ def process_plain_images(source_dir: Path, result_dir: Path) -> bool:
         logger.error(f"  缺少底图: {BACK_IMAGE}")
         return False
 
-    image_extensions = ['.png', '.jpg', '.jpeg', '.webp']
-    image_files = []
-    for ext in image_extensions:
-        image_files.extend(source_dir.glob(f'*{ext}'))
-        image_files.extend(source_dir.glob(f'*{ext.upper()}'))
-
+    image_files = list_image_files(source_dir)
     if not image_files:
         return True
 
@@ -147,21 +170,23 @@ def process_plain_images(source_dir: Path, result_dir: Path) -> bool:
 
     max_w = int(back_w * 0.7)
     max_h = int(back_h * 0.7)
-    success_count = 0
 
-    for img_file in sorted(image_files):
+    def process_one(img_file: Path) -> bool:
         output_file = result_dir / img_file.name
         if output_file.exists():
             logger.info(f"  {img_file.name} 已存在，跳过")
-            success_count += 1
-            continue
+            return True
         try:
             img = Image.open(img_file)
             orig_w, orig_h = img.size
 
             scale = min(max_w / orig_w, max_h / orig_h, 1.0)
             if scale < 1.0:
-                img = img.resize((int(orig_w * scale), int(orig_h * scale)), Image.Resampling.LANCZOS)
+                new_size = (int(orig_w * scale), int(orig_h * scale))
+                # JPEG 按目标尺寸请求 DCT 缩放解码，水印仍使用原始尺寸
+                if img.format == 'JPEG':
+                    img.draft('RGB', new_size)
+                img = resize_lanczos(img, new_size, reducing_gap=3.0)
 
             img = add_shadow_and_rounded_corners(img)
 
@@ -171,9 +196,14 @@ def process_plain_images(source_dir: Path, result_dir: Path) -> bool:
 
             save_final_puzzle_image(result_img, output_file)
             logger.info(f"  已处理: {img_file.name}")
-            success_count += 1
+            return True
         except Exception as e:
             logger.error(f"  处理图片 {img_file.name} 失败: {e}")
+            return False
+
+    max_workers = min(len(image_files), THREADS_PER_WORKER)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        success_count = sum(executor.map(process_one, image_files))
 
     logger.info(f"  处理完成: {success_count}/{len(image_files)} 张图片成功")
     return success_count > 0
@@ -203,12 +233,9 @@ def process_project(project_dir: Path, main_color: Optional[str] = None) -> bool
 
     logger.info(f"处理项目: {project_dir.name}")
 
-    image_extensions = ['.png', '.jpg', '.jpeg', '.webp']
-    subfolders = sorted([d for d in project_dir.iterdir() if d.is_dir()])
-    plain_images = [
-        f for ext in image_extensions
-        for f in list(project_dir.glob(f'*{ext}')) + list(project_dir.glob(f'*{ext.upper()}'))
-    ]
+    with os.scandir(project_dir) as entries:
+        subfolders = sorted(Path(entry.path) for entry in entries if entry.is_dir())
+    plain_images = list_image_files(project_dir)
 
     if not subfolders and not plain_images:
         logger.warning(f"项目 {project_dir.name} 下没有可处理的内容，跳过")
@@ -242,13 +269,14 @@ def process_project(project_dir: Path, main_color: Optional[str] = None) -> bool
     return success
 
 
-def process_mobile_imgs_directory(source_dir: Path, result_dir: Path) -> bool:
+def process_mobile_imgs_directory(source_dir: Path, result_dir: Path, back_img: Image.Image) -> bool:
     """
     处理 mobile-imgs 下的目录，将图片拼接到 back.png 上
 
     Args:
         source_dir: 源目录
         result_dir: 结果目录
+        back_img: 已解码的 RGB 或 RGBX 底图（只读，每张图片各自转换出 RGB 副本）
 
     Returns:
         是否成功
@@ -259,44 +287,24 @@ def process_mobile_imgs_directory(source_dir: Path, result_dir: Path) -> bool:
         logger.info(f"  结果目录已存在，跳过: {result_dir.name}")
         return True
 
-    if not BACK_IMAGE.exists():
-        logger.error(f"  缺少底图: {BACK_IMAGE}")
-        return False
-
     if not source_dir.exists() or not source_dir.is_dir():
         logger.error(f"  源目录不存在: {source_dir}")
         return False
 
     result_dir.mkdir(parents=True, exist_ok=True)
 
-    try:
-        back_img = Image.open(BACK_IMAGE)
-        if back_img.mode != 'RGB':
-            back_img = back_img.convert('RGB')
-        back_width, back_height = back_img.size
-        logger.info(f"  底图尺寸: {back_width}x{back_height}")
-    except Exception as e:
-        logger.error(f"  打开底图失败: {e}")
-        return False
-
+    back_width, back_height = back_img.size
     max_width = int(back_width * 0.7)
     max_height = int(back_height * 0.7)
 
-    image_extensions = ['.png', '.jpg', '.jpeg', '.webp']
-
-    image_files = []
-    for ext in image_extensions:
-        image_files.extend(source_dir.glob(f'*{ext}'))
-        image_files.extend(source_dir.glob(f'*{ext.upper()}'))
-
+    image_files = list_image_files(source_dir)
     if not image_files:
         logger.warning(f"  未找到任何图片文件")
         return False
 
     logger.info(f"  找到 {len(image_files)} 张图片")
 
-    success_count = 0
-    for img_file in image_files:
+    def process_one(img_file: Path) -> bool:
         try:
             img = Image.open(img_file)
             img_width, img_height = img.size
@@ -309,11 +317,14 @@ def process_mobile_imgs_directory(source_dir: Path, result_dir: Path) -> bool:
             new_height = int(img_height * scale)
 
             if scale < 1.0:
-                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+                # JPEG 按目标尺寸请求 DCT 缩放解码（只跳过多余像素，img_width/img_height 仍是原图尺寸，用于水印）
+                if img.format == 'JPEG':
+                    img.draft('RGB', (new_width, new_height))
+                img = resize_lanczos(img, (new_width, new_height), reducing_gap=3.0)
 
             img_with_effects = add_shadow_and_rounded_corners(img)
 
-            result_img = back_img.copy()
+            result_img = back_img.convert('RGB')
 
             x_offset = (back_width - img_with_effects.width) // 2
             y_offset = (back_height - img_with_effects.height) // 2
@@ -326,15 +337,43 @@ def process_mobile_imgs_directory(source_dir: Path, result_dir: Path) -> bool:
             save_final_puzzle_image(result_img, output_file)
 
             logger.info(f"  已处理: {img_file.name} -> {output_file.name}")
-            success_count += 1
+            return True
 
         except Exception as e:
             logger.error(f"  处理图片 {img_file.name} 失败: {e}")
+            return False
+
+    max_workers = min(len(image_files), THREADS_PER_WORKER)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        success_count = sum(executor.map(process_one, image_files))
 
     logger.info(f"  处理完成: {success_count}/{len(image_files)} 张图片成功")
     return success_count > 0
 
 
+def _init_worker(shm_name: str, back_size: Tuple[int, int]) -> None:
+    """
+    工作进程初始化：直接映射主进程放在共享内存中的底图像素，既不重复解码也不复制
+
+    像素按 RGBX（每像素4字节）存放，Image.frombuffer 才能零拷贝映射（RGB 每像素3字节时会复制）；
+    映射得到的图片只读，拼图时通过 convert('RGB') 得到可修改的副本
+
+    Args:
+        shm_name: 共享内存块名称
+        back_size: 底图尺寸 (width, height)
+    """
+    global _worker_back_shm, _worker_back_img
+    _worker_back_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_back_img = Image.frombuffer('RGBX', back_size, _worker_back_shm.buf, 'raw', 'RGBX', 0, 1)
+
+
+def _process_mobile_imgs_directory_worker(source_dir: Path, result_dir: Path) -> bool:
+    """
+    工作进程任务：使用进程内缓存的底图处理单个 mobile-imgs 子目录
+    """
+    return process_mobile_imgs_directory(source_dir, result_dir, _worker_back_img)
+
+
 def process_mobile_imgs() -> None:
     """
     处理 mobile-imgs 目录下的所有子目录
@@ -344,7 +383,9 @@ def process_mobile_imgs() -> None:
         logger.info(f"mobile-imgs 目录不存在，跳过")
         return
 
-    subdirs = [d for d in MOBILE_IMGS_DIR.iterdir() if d.is_dir() and not d.name.endswith('-result')]
+    with os.scandir(MOBILE_IMGS_DIR) as entries:
+        dir_names = {entry.name for entry in entries if entry.is_dir()}
+    subdirs = [MOBILE_IMGS_DIR / name for name in sorted(dir_names) if not name.endswith('-result')]
 
     if not subdirs:
         logger.info(f"mobile-imgs 目录下没有找到子目录，跳过")
@@ -352,15 +393,59 @@ def process_mobile_imgs() -> None:
 
     logger.info(f"找到 {len(subdirs)} 个子目录需要处理")
 
-    success_count = 0
+    # 结果目录是否已存在直接查上面的目录列表，已处理的目录不再提交到进程池
+    pending_dirs = []
     for source_dir in subdirs:
-        try:
-            result_dir_name = f"{source_dir.name}-result"
-            result_dir = MOBILE_IMGS_DIR / result_dir_name
-            if process_mobile_imgs_directory(source_dir, result_dir):
-                success_count += 1
-        except Exception as e:
-            logger.error(f"处理目录 {source_dir.name} 时发生错误: {e}")
+        if f"{source_dir.name}-result" in dir_names:
+            logger.info(f"  结果目录已存在，跳过: {source_dir.name}-result")
+        else:
+            pending_dirs.append(source_dir)
+    success_count = len(subdirs) - len(pending_dirs)
+
+    if not pending_dirs:
+        logger.info(f"mobile-imgs 处理完成: {success_count}/{len(subdirs)} 个目录成功")
+        return
+
+    if not BACK_IMAGE.exists():
+        logger.error(f"缺少底图: {BACK_IMAGE}")
+        return
+
+    # 底图只在主进程解码一次，通过共享内存交给各工作进程
+    try:
+        with Image.open(BACK_IMAGE) as back_img:
+            back_img = back_img.convert('RGB')
+        back_size = back_img.size
+        logger.info(f"底图尺寸: {back_size[0]}x{back_size[1]}")
+    except Exception as e:
+        logger.error(f"打开底图失败: {e}")
+        return
+
+    max_workers = min(max(1, (os.cpu_count() or 1) // THREADS_PER_WORKER), len(pending_dirs))
+    # 底图按 RGBX 放入共享内存，各工作进程直接映射，不再各持一份副本
+    back_bytes = back_img.convert('RGBX').tobytes()
+    back_shm = shared_memory.SharedMemory(create=True, size=len(back_bytes))
+    try:
+        back_shm.buf[:len(back_bytes)] = back_bytes
+        del back_bytes, back_img
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(back_shm.name, back_size)
+        ) as executor:
+            futures = {
+                executor.submit(_process_mobile_imgs_directory_worker, source_dir, MOBILE_IMGS_DIR / f"{source_dir.name}-result"): source_dir
+                for source_dir in pending_dirs
+            }
+            for future in as_completed(futures):
+                source_dir = futures[future]
+                try:
+                    if future.result():
+                        success_count += 1
+                except Exception as e:
+                    logger.error(f"处理目录 {source_dir.name} 时发生错误: {e}")
+    finally:
+        back_shm.close()
+        back_shm.unlink()
 
     logger.info(f"mobile-imgs 处理完成: {success_count}/{len(subdirs)} 个目录成功")
 
@@ -381,6 +466,8 @@ def main():
     if args.main_color is not None:
         main_color = args.main_color  # '' 表示自动提取，非空字符串表示指定颜色
 
+    log_jpeg_encoder()
+
     logger.info("=" * 50)
     logger.info("处理 mobile-imgs 目录")
     logger.info("=" * 50)
@@ -394,10 +481,9 @@ def main():
         logger.error(f"图片目录不存在: {IMGS_DIR}")
         sys.exit(1)
 
-    project_dirs = sorted([
-        d for d in IMGS_DIR.iterdir()
-        if d.is_dir() and not d.name.endswith('-result')
-    ])
+    with os.scandir(IMGS_DIR) as entries:
+        dir_names = {entry.name for entry in entries if entry.is_dir()}
+    project_dirs = [IMGS_DIR / name for name in sorted(dir_names) if not name.endswith('-result')]
 
     if not project_dirs:
         logger.warning("未找到任何项目目录")
@@ -405,13 +491,25 @@ def main():
 
     logger.info(f"找到 {len(project_dirs)} 个项目")
 
-    success_count = 0
+    pending_dirs = []
     for project_dir in project_dirs:
-        try:
-            if process_project(project_dir, main_color):
-                success_count += 1
-        except Exception as e:
-            logger.error(f"处理项目 {project_dir.name} 时发生错误: {e}")
+        if f"{project_dir.name}-result" in dir_names:
+            logger.info(f"结果目录已存在，跳过: {project_dir.name}")
+        else:
+            pending_dirs.append(project_dir)
+    success_count = len(project_dirs) - len(pending_dirs)
+
+    if pending_dirs:
+        max_workers = min(max(1, (os.cpu_count() or 1) // THREADS_PER_WORKER), len(pending_dirs))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(process_project, project_dir, main_color): project_dir for project_dir in pending_dirs}
+            for future in as_completed(futures):
+                project_dir = futures[future]
+                try:
+                    if future.result():
+                        success_count += 1
+                except Exception as e:
+                    logger.error(f"处理项目 {project_dir.name} 时发生错误: {e}")
 
     logger.info(f"处理完成: {success_count}/{len(project_dirs)} 个项目成功")
 
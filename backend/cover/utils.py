@@ -5,14 +5,24 @@
 包含拼图处理所需的公共工具函数
 """
 
+import io
 import logging
+import math
+import os
+import threading
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, Tuple
-from PIL import Image, ImageFilter, ImageDraw, ImageFont
+from PIL import Image, ImageChops, ImageFilter, ImageDraw, ImageFont, features
 import numpy as np
-from sklearn.cluster import KMeans
 import platform
 
+# cykooz.resizer 为可选依赖（Rust SIMD 实现，会自动选择 AVX2/SSE4.1 指令集），未安装时回退到 Pillow
+try:
+    from cykooz_resizer import CropBox, FilterType, ResizeAlg, ResizeOptions, Resizer
+except ImportError:
+    Resizer = None
+
 logger = logging.getLogger(__name__)
 
 # 常量定义
@@ -32,6 +42,55 @@ BORDER_RADIUS = 25  # 圆角半径（从20增加到25）
 SHADOW_OFFSET = (5, 5)
 SHADOW_BLUR = 10
 SPACING = 60  # 图片之间的间隔（从30增加到60，增大一倍）
+MAIN_COLOR_THUMBNAIL_SIZE = 256  # 提取主色调前缩小到的最大边长
+MAIN_COLOR_SAMPLE_SIZE = 20000  # 提取主色调时参与聚类的像素数
+JPEG_BYTES_PER_PIXEL_Q95 = 0.5  # 常见照片在 JPEG 质量 95 时每像素约占的字节数（估算试探质量用）
+
+# Lanczos3 缩放器（每个线程复用一个实例，Resizer 内部缓冲区不能在线程间共享）
+_resizer_local = threading.local()
+if Resizer is not None:
+    _RESIZE_OPTIONS = ResizeOptions(resize_alg=ResizeAlg.convolution(FilterType.lanczos3))
+
+
+def _get_resizer() -> Optional['Resizer']:
+    """
+    获取当前线程的 Lanczos3 缩放器，未安装 cykooz.resizer 时返回 None
+    """
+    if Resizer is None:
+        return None
+    resizer = getattr(_resizer_local, 'resizer', None)
+    if resizer is None:
+        resizer = _resizer_local.resizer = Resizer()
+    return resizer
+
+
+def resize_lanczos(image: Image.Image, size: Tuple[int, int], reducing_gap: Optional[float] = None,
+                   box: Optional[Tuple[float, float, float, float]] = None) -> Image.Image:
+    """
+    使用 Lanczos3 算法缩放图片，RGB/RGBA 图片优先使用 cykooz.resizer，其余情况回退到 Pillow
+
+    Args:
+        image: 原始图片
+        size: 目标尺寸 (width, height)
+        reducing_gap: 回退到 Pillow 时使用，先按整数倍快速缩小到目标尺寸的 reducing_gap 倍再做 Lanczos
+        box: 只缩放原图中的这一区域 (left, top, right, bottom)，裁剪与缩放一次完成
+
+    Returns:
+        缩放后的图片（与原图模式相同）
+    """
+    resizer = _get_resizer()
+    if resizer is None or image.mode not in ('RGB', 'RGBA'):
+        return image.resize(size, Image.Resampling.LANCZOS, box=box, reducing_gap=reducing_gap)
+
+    options = _RESIZE_OPTIONS
+    if box is not None:
+        left, top, right, bottom = box
+        options = ResizeOptions(resize_alg=_RESIZE_OPTIONS.resize_alg,
+                                crop_box=CropBox(left, top, right - left, bottom - top))
+
+    dst = Image.new(image.mode, size)
+    resizer.resize_pil(image, dst, options)
+    return dst
 
 
 def extract_main_color(image: Image.Image, k: int = 3) -> Tuple[int, int, int]:
@@ -45,18 +104,28 @@ def extract_main_color(image: Image.Image, k: int = 3) -> Tuple[int, int, int]:
     Returns:
         RGB 颜色元组
     """
-    # 将图片转换为 numpy 数组
-    img_array = np.array(image)
-
-    # 如果是 RGBA，只取 RGB
-    if img_array.shape[2] == 4:
-        img_array = img_array[:, :, :3]
+    # 主色调与分辨率无关，先用 BILINEAR 缩小到 256 以内再转换为数组（不修改传入的图片）
+    scale = MAIN_COLOR_THUMBNAIL_SIZE / max(image.size)
+    if scale < 1.0:
+        thumb_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(thumb_size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+    # 统一转换为 RGB（RGBA/L/P 等模式均可处理），得到连续的 3 通道数组，reshape 时不会再复制
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    img_array = np.asarray(image)
 
     # 重塑为二维数组 (像素数, RGB)
     pixels = img_array.reshape(-1, 3)
 
-    # 使用 K-means 聚类
-    kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
+    # 主色调只需要颜色分布，均匀抽样 2 万个像素即可，不必对全部像素聚类
+    if pixels.shape[0] > MAIN_COLOR_SAMPLE_SIZE:
+        rng = np.random.default_rng(42)
+        pixels = pixels[rng.choice(pixels.shape[0], size=MAIN_COLOR_SAMPLE_SIZE, replace=False)]
+
+    # 使用 Mini-Batch K-means 聚类（sklearn 导入耗时近 1 秒，只在真正提取主色调时才导入）
+    from sklearn.cluster import MiniBatchKMeans
+    kmeans = MiniBatchKMeans(n_clusters=k, random_state=42, n_init=3, batch_size=1024, max_iter=50)
     kmeans.fit(pixels)
 
     # 获取最大的聚类中心（主色调）
@@ -68,16 +137,41 @@ def extract_main_color(image: Image.Image, k: int = 3) -> Tuple[int, int, int]:
     return tuple(map(int, main_color))
 
 
+def resolve_main_color(main_color: Optional[str], source_file: Optional[Path]) -> Optional[str]:
+    """
+    将自动提取（main_color=""）解析为具体的 16 进制颜色，供多个拼图共用同一张源图的主色调
+
+    Args:
+        main_color: 主色调参数（None、"" 或 16 进制颜色代码）
+        source_file: 用于提取主色调的源图片路径
+
+    Returns:
+        main_color="" 且提取成功时返回 "#rrggbb"，否则原样返回 main_color
+    """
+    if main_color != '' or source_file is None:
+        return main_color
+    try:
+        with Image.open(source_file) as source_image:
+            # JPEG 源图直接按 1/2、1/4、1/8 缩小解码（主色调只需要 256 以内的缩略图）
+            source_image.draft('RGB', (MAIN_COLOR_THUMBNAIL_SIZE, MAIN_COLOR_THUMBNAIL_SIZE))
+            r, g, b = extract_main_color(source_image)
+    except Exception as e:
+        logger.warning(f"  提取主色调失败: {e}")
+        return main_color
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+@lru_cache(maxsize=4)
 def create_rounded_rectangle_mask(size: Tuple[int, int], radius: int) -> Image.Image:
     """
-    创建圆角矩形遮罩
+    创建圆角矩形遮罩（按尺寸和半径缓存，遮罩为整图大小，只保留最近几种尺寸）
 
     Args:
         size: 图片尺寸 (width, height)
         radius: 圆角半径
 
     Returns:
-        遮罩图片
+        遮罩图片（缓存共享，调用方只能读取，不能修改）
     """
     mask = Image.new('L', size, 0)
     draw = ImageDraw.Draw(mask)
@@ -92,52 +186,105 @@ def create_rounded_rectangle_mask(size: Tuple[int, int], radius: int) -> Image.I
     return mask
 
 
-def add_shadow_and_rounded_corners(image: Image.Image, radius: int = BORDER_RADIUS) -> Image.Image:
+@lru_cache(maxsize=8)
+def _blurred_shadow_tile(small_width: int, small_height: int, radius: int) -> Image.Image:
     """
-    为图片添加阴影和圆角效果
+    生成模糊后的小阴影块（圆角矩形边长不超过边缘宽度的两倍，按尺寸和半径缓存）
+
+    阴影是纯黑色，只需对单通道做模糊；小阴影块的尺寸与图片尺寸基本无关，不同尺寸的图片共用同一块
 
     Args:
-        image: 原始图片
+        small_width: 小圆角矩形宽度
+        small_height: 小圆角矩形高度
         radius: 圆角半径
 
     Returns:
-        处理后的图片
+        模糊后的阴影块（L 模式，缓存共享，调用方只能读取，不能修改）
     """
-    # 创建带阴影的画布（增加边距以容纳阴影）
     shadow_margin = max(SHADOW_OFFSET) + SHADOW_BLUR
-    canvas_size = (
-        image.width + shadow_margin * 2,
-        image.height + shadow_margin * 2
-    )
 
-    # 创建阴影层
-    shadow = Image.new('RGBA', canvas_size, (0, 0, 0, 0))
-    shadow_draw = ImageDraw.Draw(shadow)
-
-    # 绘制阴影（使用半透明黑色）
-    shadow_rect = [
-        (shadow_margin + SHADOW_OFFSET[0], shadow_margin + SHADOW_OFFSET[1]),
-        (shadow_margin + image.width + SHADOW_OFFSET[0], shadow_margin + image.height + SHADOW_OFFSET[1])
-    ]
-    shadow_draw.rounded_rectangle(
-        shadow_rect,
+    # 绘制阴影（透明度100的圆角矩形）
+    shadow = Image.new('L', (small_width + shadow_margin * 2, small_height + shadow_margin * 2), 0)
+    ImageDraw.Draw(shadow).rounded_rectangle(
+        [
+            (shadow_margin + SHADOW_OFFSET[0], shadow_margin + SHADOW_OFFSET[1]),
+            (shadow_margin + small_width + SHADOW_OFFSET[0], shadow_margin + small_height + SHADOW_OFFSET[1])
+        ],
         radius=radius,
-        fill=(0, 0, 0, 100)
+        fill=100
     )
 
     # 模糊阴影
-    shadow = shadow.filter(ImageFilter.GaussianBlur(radius=SHADOW_BLUR))
+    return shadow.filter(ImageFilter.GaussianBlur(radius=SHADOW_BLUR))
+
+
+def _blurred_shadow(width: int, height: int, radius: int) -> Image.Image:
+    """
+    生成模糊后的阴影层（尺寸为图片加上两侧阴影边距）
+
+    圆角矩形的阴影只在边缘附近变化，中间部分每行（列）都相同，
+    因此只模糊一个小圆角矩形，再重复其中间行（列）展开到目标尺寸，结果与直接模糊完全一致
+
+    Args:
+        width: 图片宽度
+        height: 图片高度
+        radius: 圆角半径
+
+    Returns:
+        阴影层（RGBA模式，黑色）
+    """
+    shadow_margin = max(SHADOW_OFFSET) + SHADOW_BLUR
+    edge = radius + SHADOW_BLUR * 4 + 2
+    small_width = min(width, edge * 2)
+    small_height = min(height, edge * 2)
+
+    def stretch_index(small_len: int, full_len: int, offset: int) -> np.ndarray:
+        mid = shadow_margin + offset + small_len // 2
+        return np.concatenate([
+            np.arange(mid),
+            np.full(full_len - small_len, mid),
+            np.arange(mid, small_len + shadow_margin * 2)
+        ])
+
+    shadow = _blurred_shadow_tile(small_width, small_height, radius)
+    if (small_width, small_height) != (width, height):
+        rows = stretch_index(small_height, height, SHADOW_OFFSET[1])
+        cols = stretch_index(small_width, width, SHADOW_OFFSET[0])
+        shadow = Image.fromarray(np.asarray(shadow)[np.ix_(rows, cols)], 'L')
+
+    layer = Image.new('RGBA', shadow.size, (0, 0, 0, 0))
+    layer.putalpha(shadow)
+    return layer
+
+
+def add_shadow_and_rounded_corners(image: Image.Image, radius: int = BORDER_RADIUS) -> Image.Image:
+    """
+    为图片添加阴影和圆角效果
+
+    Args:
+        image: 原始图片
+        radius: 圆角半径
+
+    Returns:
+        处理后的图片
+    """
+    # 阴影边距
+    shadow_margin = max(SHADOW_OFFSET) + SHADOW_BLUR
+
+    # 创建带阴影的画布
+    shadow = _blurred_shadow(image.width, image.height, radius)
 
     # 创建圆角遮罩
     mask = create_rounded_rectangle_mask(image.size, radius)
 
-    # 如果原图有透明通道，应用遮罩
-    if image.mode == 'RGBA':
+    # 应用遮罩（RGB 图片复制后直接 putalpha，比先 convert('RGBA') 少一次整图转换；
+    # 原本就有透明通道的图片与遮罩相乘，保留原有的透明区域）
+    if image.mode == 'RGB':
         image = image.copy()
         image.putalpha(mask)
     else:
         image = image.convert('RGBA')
-        image.putalpha(mask)
+        image.putalpha(ImageChops.multiply(image.getchannel('A'), mask))
 
     # 将图片粘贴到阴影层上
     shadow.paste(image, (shadow_margin, shadow_margin), image)
@@ -147,7 +294,7 @@ def add_shadow_and_rounded_corners(image: Image.Image, radius: int = BORDER_RADI
 
 def overlay_images(base: Image.Image, overlay: Image.Image) -> Image.Image:
     """
-    将覆盖图片叠加到底图上
+    将覆盖图片叠加到底图上（尺寸不一致时覆盖图直接缩放到底图尺寸）
 
     Args:
         base: 底图
@@ -158,7 +305,11 @@ def overlay_images(base: Image.Image, overlay: Image.Image) -> Image.Image:
     """
     # 确保两张图片尺寸一致
     if base.size != overlay.size:
-        overlay = overlay.resize(base.size, Image.Resampling.LANCZOS)
+        overlay = resize_lanczos(overlay, base.size)
+
+    # 覆盖图没有透明通道时叠加结果就是覆盖图本身，无需逐像素混合
+    if overlay.mode in ('RGB', 'L') and 'transparency' not in overlay.info:
+        return overlay.convert('RGBA')
 
     # 如果底图没有透明通道，转换为 RGBA
     if base.mode != 'RGBA':
@@ -185,13 +336,47 @@ def get_image_file(work_dir: Path, base_name: str) -> Optional[Path]:
     Returns:
         图片文件路径，如果不存在则返回 None
     """
+    # 一次 scandir 列出目录，代替逐个扩展名的 exists() 探测
+    try:
+        with os.scandir(work_dir) as entries:
+            names = {entry.name for entry in entries if entry.is_file()}
+    except FileNotFoundError:
+        return None
+
     for ext in ['.png', '.jpg', '.jpeg', '.webp']:
-        file_path = work_dir / f"{base_name}{ext}"
-        if file_path.exists():
-            return file_path
+        file_name = f"{base_name}{ext}"
+        if file_name in names:
+            return work_dir / file_name
     return None
 
 
+@lru_cache(maxsize=1)
+def _load_back_image() -> Image.Image:
+    """
+    解码默认背景图（back.png），整个进程只解码一次
+
+    Returns:
+        背景图（缓存共享，调用方只能读取，不能修改）
+    """
+    back_img = Image.open(BACK_IMAGE)
+    back_img.load()
+    return back_img
+
+
+@lru_cache(maxsize=32)
+def _resized_back_image(size: Tuple[int, int]) -> Image.Image:
+    """
+    获取缩放到指定尺寸的默认背景图（按尺寸缓存，同类拼图的画布尺寸固定）
+
+    Args:
+        size: 背景尺寸
+
+    Returns:
+        缩放后的背景图（缓存共享，调用方需要 copy() 后再修改）
+    """
+    return resize_lanczos(_load_back_image(), size)
+
+
 def create_background(size: Tuple[int, int], main_color: Optional[str] = None, source_image: Optional[Image.Image] = None) -> Image.Image:
     """
     创建背景图片
@@ -211,8 +396,7 @@ def create_background(size: Tuple[int, int], main_color: Optional[str] = None, s
     """
     # 如果 main_color 是 None，始终使用默认背景（back.jpg）
     if main_color is None:
-        bg = Image.open(BACK_IMAGE)
-        return bg.resize(size, Image.Resampling.LANCZOS)
+        return _resized_back_image(size).copy()
 
     # 如果 main_color 是空字符串，表示自动提取主色调
     if main_color == '':
@@ -222,8 +406,7 @@ def create_background(size: Tuple[int, int], main_color: Optional[str] = None, s
             return Image.new('RGB', size, bg_color)
         else:
             # 没有源图片，使用默认背景
-            bg = Image.open(BACK_IMAGE)
-            return bg.resize(size, Image.Resampling.LANCZOS)
+            return _resized_back_image(size).copy()
 
     # 如果 main_color 有值，使用纯色背景
     # 解析颜色代码
@@ -243,8 +426,7 @@ def create_background(size: Tuple[int, int], main_color: Optional[str] = None, s
         return Image.new('RGB', size, bg_color)
     except (ValueError, IndexError):
         logger.warning(f"  无效的颜色代码: {main_color}，使用默认背景")
-        bg = Image.open(BACK_IMAGE)
-        return bg.resize(size, Image.Resampling.LANCZOS)
+        return _resized_back_image(size).copy()
 
 
 def resize_to_fit_ratio(image: Image.Image, target_ratio: float, max_size: Tuple[int, int]) -> Image.Image:
@@ -265,7 +447,7 @@ def resize_to_fit_ratio(image: Image.Image, target_ratio: float, max_size: Tuple
         # 比例已经匹配，只需缩放
         scale = min(max_size[0] / image.width, max_size[1] / image.height)
         new_size = (int(image.width * scale), int(image.height * scale))
-        return image.resize(new_size, Image.Resampling.LANCZOS)
+        return resize_lanczos(image, new_size)
 
     # 需要调整比例
     # 计算在目标比例下的最大尺寸
@@ -282,19 +464,21 @@ def resize_to_fit_ratio(image: Image.Image, target_ratio: float, max_size: Tuple
     scale = min(max_width / image.width, max_height / image.height)
     new_size = (int(image.width * scale), int(image.height * scale))
 
-    # 调整到目标比例
+    # 调整到目标比例：裁剪框换算回原图坐标，裁剪与缩放一次完成，不再缩放随后被裁掉的像素
+    scale_x = new_size[0] / image.width
+    scale_y = new_size[1] / image.height
     if new_size[0] / new_size[1] > target_ratio:
         # 需要裁剪宽度
         new_width = int(new_size[1] * target_ratio)
         crop_left = (new_size[0] - new_width) // 2
-        resized = image.resize(new_size, Image.Resampling.LANCZOS)
-        return resized.crop((crop_left, 0, crop_left + new_width, new_size[1]))
+        box = (crop_left / scale_x, 0, (crop_left + new_width) / scale_x, image.height)
+        return resize_lanczos(image, (new_width, new_size[1]), box=box)
     else:
         # 需要裁剪高度
         new_height = int(new_size[0] / target_ratio)
         crop_top = (new_size[1] - new_height) // 2
-        resized = image.resize(new_size, Image.Resampling.LANCZOS)
-        return resized.crop((0, crop_top, new_size[0], crop_top + new_height))
+        box = (0, crop_top / scale_y, image.width, (crop_top + new_height) / scale_y)
+        return resize_lanczos(image, (new_size[0], new_height), box=box)
 
 
 def save_optimized_image(image: Image.Image, output_file: Path, quality: int = 95) -> None:
@@ -306,50 +490,42 @@ def save_optimized_image(image: Image.Image, output_file: Path, quality: int = 9
         output_file: 输出文件路径
         quality: 初始质量（用于 JPEG）
     """
-    # 先尝试保存为 PNG
-    image.save(output_file, 'PNG', optimize=True)
-
-    # 检查文件大小
-    file_size = output_file.stat().st_size
+    # 先在内存中编码为 PNG，未超过限制才写入磁盘（超限时无需再写入后删除）
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', optimize=True)
+    file_size = buffer.tell()
 
-    if file_size > MAX_FILE_SIZE:
+    if file_size <= MAX_FILE_SIZE:
+        output_file.write_bytes(buffer.getvalue())
+    else:
         # 如果超过 2MB，转换为 JPEG 并降低质量
         logger.info(f"  文件大小 {file_size / 1024 / 1024:.2f}MB 超过限制，转换为 JPEG")
 
         # 如果原图有透明通道，需要添加白色背景
         if image.mode == 'RGBA':
             bg = Image.new('RGB', image.size, (255, 255, 255))
-            bg.paste(image, mask=image.split()[3])
+            bg.paste(image, mask=image)  # RGBA 图片直接作为遮罩（使用其透明通道）
             image = bg
         else:
             image = image.convert('RGB')
 
-        # 删除 PNG 文件
-        output_file.unlink()
-
         # 生成 JPG 文件路径
         output_file_jpg = output_file.with_suffix('.jpg')
 
-        # 逐步降低质量直到文件大小符合要求
-        current_quality = quality
-        while current_quality > 50:
-            image.save(output_file_jpg, 'JPEG', quality=current_quality, optimize=True)
-            file_size = output_file_jpg.stat().st_size
-
-            if file_size <= MAX_FILE_SIZE:
-                logger.info(f"  已优化为 JPEG，质量: {current_quality}，大小: {file_size / 1024 / 1024:.2f}MB")
-                return
-
-            current_quality -= 5
+        # 二分查找不超过限制的最高质量（55 ~ quality）
+        current_quality, data, fits = _search_max_jpeg_quality(image, MAX_FILE_SIZE, 55, quality)
+        if fits:
+            output_file_jpg.write_bytes(data)
+            logger.info(f"  已优化为 JPEG，质量: {current_quality}，大小: {len(data) / 1024 / 1024:.2f}MB")
+            return
 
-        # 如果质量降到 50 还是太大，需要缩小尺寸
-        if file_size > MAX_FILE_SIZE:
-            scale = (MAX_FILE_SIZE / file_size) ** 0.5
-            new_size = (int(image.width * scale), int(image.height * scale))
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-            image.save(output_file_jpg, 'JPEG', quality=75, optimize=True)
-            file_size = output_file_jpg.stat().st_size
-            logger.info(f"  已缩小尺寸并保存为 JPEG，大小: {file_size / 1024 / 1024:.2f}MB")
+        # 如果质量降到 55 还是太大，需要缩小尺寸
+        scale = (MAX_FILE_SIZE / len(data)) ** 0.5
+        new_size = (int(image.width * scale), int(image.height * scale))
+        image = resize_lanczos(image, new_size)
+        data = _encode_jpeg(image, 75, optimize=True)
+        output_file_jpg.write_bytes(data)
+        logger.info(f"  已缩小尺寸并保存为 JPEG，大小: {len(data) / 1024 / 1024:.2f}MB")
 
 
 def save_optimized_jpeg(image: Image.Image, output_file: Path, max_size: int = MAX_JPEG_SIZE, quality: int = 95) -> None:
@@ -365,53 +541,180 @@ def save_optimized_jpeg(image: Image.Image, output_file: Path, max_size: int = M
     # 确保图片是 RGB 模式（JPEG 不支持透明通道）
     if image.mode == 'RGBA':
         bg = Image.new('RGB', image.size, (255, 255, 255))
-        bg.paste(image, mask=image.split()[3])
+        bg.paste(image, mask=image)
         image = bg
     elif image.mode != 'RGB':
         image = image.convert('RGB')
 
-    # 逐步降低质量直到文件大小符合要求
-    current_quality = quality
-    while current_quality > 30:
-        image.save(output_file, 'JPEG', quality=current_quality, optimize=True)
-        file_size = output_file.stat().st_size
+    # 二分查找不超过限制的最高质量（35 ~ quality）
+    current_quality, data, fits = _search_max_jpeg_quality(image, max_size, 35, quality)
+    if fits:
+        output_file.write_bytes(data)
+        logger.info(f"  已保存 JPEG，质量: {current_quality}，大小: {len(data) / 1024:.2f}KB")
+        return
 
-        if file_size <= max_size:
-            logger.info(f"  已保存 JPEG，质量: {current_quality}，大小: {file_size / 1024:.2f}KB")
-            return
+    # 如果质量降到 35 还是太大，需要缩小尺寸
+    scale = (max_size / len(data)) ** 0.5
+    new_size = (int(image.width * scale), int(image.height * scale))
+    image = resize_lanczos(image, new_size)
 
-        current_quality -= 5
+    # 重新查找，最高从 75 开始
+    current_quality, data, fits = _search_max_jpeg_quality(image, max_size, 35, 75)
+    if fits:
+        output_file.write_bytes(data)
+        logger.info(f"  已缩小尺寸并保存为 JPEG，质量: {current_quality}，大小: {len(data) / 1024:.2f}KB")
+        return
 
-    # 如果质量降到 30 还是太大，需要缩小尺寸
-    file_size = output_file.stat().st_size
-    if file_size > max_size:
-        # 计算缩放比例
-        scale = (max_size / file_size) ** 0.5
-        new_size = (int(image.width * scale), int(image.height * scale))
-        image = image.resize(new_size, Image.Resampling.LANCZOS)
-        
-        # 重新尝试保存，从较低质量开始
-        current_quality = 75
-        while current_quality > 30:
-            image.save(output_file, 'JPEG', quality=current_quality, optimize=True)
-            file_size = output_file.stat().st_size
-            
-            if file_size <= max_size:
-                logger.info(f"  已缩小尺寸并保存为 JPEG，质量: {current_quality}，大小: {file_size / 1024:.2f}KB")
-                return
-            
-            current_quality -= 5
-        
-        # 如果还是太大，使用最低质量
-        image.save(output_file, 'JPEG', quality=30, optimize=True)
-        file_size = output_file.stat().st_size
-        logger.info(f"  已缩小尺寸并保存为 JPEG（最低质量），大小: {file_size / 1024:.2f}KB")
+    # 如果还是太大，使用最低质量
+    data = _encode_jpeg(image, 30, optimize=True)
+    output_file.write_bytes(data)
+    logger.info(f"  已缩小尺寸并保存为 JPEG（最低质量），大小: {len(data) / 1024:.2f}KB")
+
+
+def log_jpeg_encoder() -> None:
+    """
+    记录当前 Pillow 使用的 JPEG 编码库，便于确认是否启用了 libjpeg-turbo 的 SIMD 加速
+    """
+    if features.check_feature('libjpeg_turbo'):
+        logger.info(f"JPEG 编码库: libjpeg-turbo {features.version_feature('libjpeg_turbo')}")
+    else:
+        logger.warning(f"JPEG 编码库: libjpeg {features.version('jpg')}（未使用 libjpeg-turbo，编码速度较慢）")
+
+
+def _encode_jpeg(image: Image.Image, quality: int, optimize: bool = False) -> bytes:
+    """
+    在内存中编码 JPEG，不写磁盘
+
+    Args:
+        image: RGB 图片
+        quality: JPEG 质量
+        optimize: 是否优化霍夫曼表（更慢，文件略小）
+
+    Returns:
+        JPEG 数据
+    """
+    buf = io.BytesIO()
+    image.save(buf, 'JPEG', quality=quality, optimize=optimize)
+    return buf.getvalue()
+
+
+def _search_max_jpeg_quality(image: Image.Image, max_size: int, min_quality: int, max_quality: int) -> Tuple[int, bytes, bool]:
+    """
+    二分查找文件大小不超过 max_size 的最高 JPEG 质量
+
+    先试探 max_quality（小图通常直接满足），否则在 [min_quality, max_quality) 内二分。
+    试探时不优化霍夫曼表，选定质量后再用 optimize=True 编码一次（文件只会变小）
+
+    Args:
+        image: RGB 图片
+        max_size: 最大文件大小（字节）
+        min_quality: 最低质量
+        max_quality: 最高质量
+
+    Returns:
+        (质量, optimize 后的 JPEG 数据, 是否不超过 max_size)；最低质量仍超出时返回最低质量的结果
+    """
+    best_quality = None
+    lo, hi = min_quality, max_quality
+    quality = max_quality
+    while lo <= hi:
+        if len(_encode_jpeg(image, quality)) <= max_size:
+            best_quality = quality
+            lo = quality + 1
+        else:
+            hi = quality - 1
+        quality = (lo + hi) // 2
+
+    if best_quality is None:
+        data = _encode_jpeg(image, min_quality, optimize=True)
+        return min_quality, data, len(data) <= max_size
+    return best_quality, _encode_jpeg(image, best_quality, optimize=True), True
+
+
+def _estimate_jpeg_quality(image_size: Tuple[int, int], max_size: int) -> int:
+    """
+    按像素数粗略估算文件大小不超过 max_size 的 JPEG 质量，最高质量超出上限后作为质量搜索的下一个试探值
+
+    像素数每翻一倍（相对质量 95 时刚好满足的像素数），质量下调 10
+
+    Args:
+        image_size: 图片尺寸 (width, height)
+        max_size: 最大文件大小（字节）
+
+    Returns:
+        估算的质量（40 ~ 95）
+    """
+    pixels = image_size[0] * image_size[1]
+    ratio = pixels * JPEG_BYTES_PER_PIXEL_Q95 / max_size
+    return max(40, min(95, int(95 - 10 * math.log2(max(1.0, ratio)))))
+
+
+def _search_jpeg_quality(
+    image: Image.Image,
+    min_size: int,
+    max_size: int,
+    target_size: int,
+    min_quality: int = 30,
+    max_quality: int = 95,
+    first_quality: Optional[int] = None,
+    next_quality: Optional[int] = None
+) -> Tuple[int, bytes, bool]:
+    """
+    二分查找 JPEG 质量，使文件大小落在 [min_size, max_size] 之间
+
+    文件大小随质量单调增加：偏大时降低质量，偏小或已在范围内时提高质量，最终返回范围内的最高质量。
+    试探时即使用 optimize=True 编码，按最终写入的文件大小判断是否落在范围内；
+    指定 first_quality 时先试探该质量，指定 next_quality 时其次试探该质量（仍在剩余区间内时），再在剩余区间内二分
+
+    Args:
+        image: RGB 图片
+        min_size: 最小文件大小（字节）
+        max_size: 最大文件大小（字节）
+        target_size: 目标文件大小（字节），未命中范围时取最接近它的结果
+        min_quality: 最低质量
+        max_quality: 最高质量
+        first_quality: 首次试探的质量（可选）
+        next_quality: 第二次试探的质量（可选）
+
+    Returns:
+        (质量, JPEG 数据, 是否落在范围内)
+    """
+    in_range_quality, in_range_data = max_quality, b''
+    best_quality, best_data = max_quality, b''
+    lo, hi = min_quality, max_quality
+    while lo <= hi:
+        if first_quality is not None and lo <= first_quality <= hi:
+            quality, first_quality = first_quality, None
+        elif next_quality is not None and lo <= next_quality <= hi:
+            quality, next_quality = next_quality, None
+        else:
+            quality = (lo + hi) // 2
+        data = _encode_jpeg(image, quality, optimize=True)
+        size = len(data)
+
+        if min_size <= size <= max_size:
+            # 命中范围后继续向上查找，保留范围内的最高质量
+            in_range_quality, in_range_data = quality, data
+        elif not best_data or abs(size - target_size) < abs(len(best_data) - target_size):
+            # 记录最接近目标大小的质量
+            best_quality, best_data = quality, data
+
+        if size > max_size:
+            hi = quality - 1
+        else:
+            lo = quality + 1
+
+    if in_range_data:
+        return in_range_quality, in_range_data, True
+    return best_quality, best_data, False
 
 
 def save_final_puzzle_image(image: Image.Image, output_file: Path, target_size: int = 250 * 1024) -> None:
     """
     保存最终拼图结果图片，统一压缩到200-300KB之间
     
+    质量搜索在内存中完成（先试探最高质量，超出上限时试探按像素数估算的质量，再二分查找，找出落在范围内的最高质量），最终只写一次磁盘
+    
     Args:
         image: 图片对象
         output_file: 输出文件路径
@@ -428,7 +731,7 @@ def save_final_puzzle_image(image: Image.Image, output_file: Path, target_size:
     # 确保图片是 RGB 模式（JPEG 不支持透明通道）
     if image.mode == 'RGBA':
         bg = Image.new('RGB', image.size, (255, 255, 255))
-        bg.paste(image, mask=image.split()[3])
+        bg.paste(image, mask=image)
         image = bg
     elif image.mode != 'RGB':
         image = image.convert('RGB')
@@ -437,75 +740,36 @@ def save_final_puzzle_image(image: Image.Image, output_file: Path, target_size:
     if output_file.suffix.lower() == '.png':
         output_file = output_file.with_suffix('.jpg')
     
-    # 先尝试高质量保存，检查文件大小
-    current_quality = 95
-    best_quality = current_quality
-    best_size = 0
-    
-    # 从高质量开始逐步降低，找到最接近目标大小的质量
-    while current_quality >= 30:
-        image.save(output_file, 'JPEG', quality=current_quality, optimize=True)
-        file_size = output_file.stat().st_size
-        
-        # 如果文件大小在目标范围内，直接返回
-        if min_size <= file_size <= max_size:
-            logger.info(f"  已保存最终拼图结果，质量: {current_quality}，大小: {file_size / 1024:.2f}KB")
-            return
-        
-        # 记录最接近目标大小的质量
-        if best_size == 0 or abs(file_size - target_size) < abs(best_size - target_size):
-            best_quality = current_quality
-            best_size = file_size
-        
-        # 如果文件太大，继续降低质量
-        if file_size > max_size:
-            current_quality -= 5
-        # 如果文件太小，需要提高质量（但我们已经从高到低，所以这种情况不应该发生）
-        else:
-            break
-    
-    # 如果找到的质量对应的文件大小不在范围内，需要调整
-    if best_size > max_size:
-        # 文件太大，需要缩小尺寸
+    # 先试探最高质量（细节少的图片在95时就落在范围内），超出上限时再试探按像素数估算的质量
+    next_quality = _estimate_jpeg_quality(image.size, max_size)
+    quality, data, in_range = _search_jpeg_quality(
+        image, min_size, max_size, target_size, first_quality=95, next_quality=next_quality
+    )
+    resized = False
+
+    if not in_range and len(data) > max_size:
+        # 最低质量仍然太大，需要缩小尺寸
         # 计算缩放比例，使文件大小接近目标大小
-        scale = (target_size / best_size) ** 0.5
+        scale = (target_size / len(data)) ** 0.5
         new_size = (int(image.width * scale), int(image.height * scale))
-        resized_image = image.resize(new_size, Image.Resampling.LANCZOS)
-        
-        # 重新尝试保存，从较高质量开始
-        current_quality = 85
-        while current_quality >= 30:
-            resized_image.save(output_file, 'JPEG', quality=current_quality, optimize=True)
-            file_size = output_file.stat().st_size
-            
-            if min_size <= file_size <= max_size:
-                logger.info(f"  已缩小尺寸并保存最终拼图结果，质量: {current_quality}，大小: {file_size / 1024:.2f}KB")
-                return
-            
-            if file_size > max_size:
-                current_quality -= 5
-            else:
-                # 文件太小，使用当前质量即可
-                logger.info(f"  已缩小尺寸并保存最终拼图结果，质量: {current_quality}，大小: {file_size / 1024:.2f}KB")
-                return
-        
-        # 如果还是太大，使用最低质量
-        resized_image.save(output_file, 'JPEG', quality=30, optimize=True)
-        file_size = output_file.stat().st_size
-        logger.info(f"  已缩小尺寸并保存最终拼图结果（最低质量），大小: {file_size / 1024:.2f}KB")
-    elif best_size < min_size:
-        # 文件太小，使用最佳质量即可（这种情况很少见）
-        image.save(output_file, 'JPEG', quality=best_quality, optimize=True)
-        logger.info(f"  已保存最终拼图结果，质量: {best_quality}，大小: {best_size / 1024:.2f}KB")
+        image = resize_lanczos(image, new_size)
+        resized = True
+
+        # 重新搜索，最高从85开始
+        quality, data, in_range = _search_jpeg_quality(image, min_size, max_size, target_size, max_quality=85)
+
+    output_file.write_bytes(data)
+    file_size = len(data)
+    if resized:
+        logger.info(f"  已缩小尺寸并保存最终拼图结果，质量: {quality}，大小: {file_size / 1024:.2f}KB")
     else:
-        # 使用最佳质量
-        image.save(output_file, 'JPEG', quality=best_quality, optimize=True)
-        logger.info(f"  已保存最终拼图结果，质量: {best_quality}，大小: {best_size / 1024:.2f}KB")
+        logger.info(f"  已保存最终拼图结果，质量: {quality}，大小: {file_size / 1024:.2f}KB")
 
 
+@lru_cache(maxsize=1)
 def get_font_path() -> Optional[str]:
     """
-    获取支持中文的字体路径
+    获取支持中文的字体路径（结果在进程内缓存，只查找一次）
     
     Returns:
         字体路径，如果找不到则返回 None
@@ -561,25 +825,18 @@ def get_font_path() -> Optional[str]:
                 continue
     
     # 如果所有预设路径都找不到，尝试使用 fontconfig 查找（如果可用）
+    # 一次 fc-list 直接列出支持中文的字体文件（按路径排序，结果稳定）
     try:
         import subprocess
         result = subprocess.run(
-            ['fc-list', ':lang=zh', 'family'],
+            ['fc-list', '-f', '%{file}\n', ':lang=zh'],
             capture_output=True,
             text=True,
             timeout=2
         )
-        if result.returncode == 0 and result.stdout:
-            # 尝试查找字体文件路径
-            result_path = subprocess.run(
-                ['fc-match', '-f', '%{file}', ':lang=zh'],
-                capture_output=True,
-                text=True,
-                timeout=2
-            )
-            if result_path.returncode == 0 and result_path.stdout.strip():
-                font_file = result_path.stdout.strip()
-                if Path(font_file).exists():
+        if result.returncode == 0:
+            for font_file in sorted(line.strip() for line in result.stdout.splitlines()):
+                if font_file and Path(font_file).exists():
                     return font_file
     except Exception:
         pass
@@ -587,6 +844,45 @@ def get_font_path() -> Optional[str]:
     return None
 
 
+@lru_cache(maxsize=8)
+def _load_watermark_font(font_size: int) -> ImageFont.ImageFont:
+    """
+    加载水印字体（按字号缓存，避免每张图片都重新查找并解析字体文件）
+
+    Args:
+        font_size: 字体大小
+
+    Returns:
+        字体对象
+    """
+    # 水印为英文，使用常见英文字体避免乱码
+    for name in ['DejaVuSans.ttf', 'arial.ttf', 'Arial.ttf']:
+        try:
+            return ImageFont.truetype(name, font_size)
+        except Exception:
+            continue
+    return ImageFont.load_default()
+
+
+@lru_cache(maxsize=64)
+def _render_size_badge(size_text: str, font_size: int) -> Tuple[Image.Image, Tuple[int, int, int, int]]:
+    """
+    渲染尺寸水印文字的遮罩（按文字和字号缓存，同一批图片的尺寸大多相同）
+
+    Args:
+        size_text: 水印文字
+        font_size: 字体大小
+
+    Returns:
+        (L 模式遮罩, 文字边界框)，文字锚点位于遮罩 (0, 0)（缓存共享，调用方只能读取，不能修改）
+    """
+    font = _load_watermark_font(font_size)
+    bbox = ImageDraw.Draw(Image.new('L', (1, 1))).textbbox((0, 0), size_text, font=font)
+    badge = Image.new('L', (max(bbox[2], 1), max(bbox[3], 1)), 0)
+    ImageDraw.Draw(badge).text((0, 0), size_text, fill=255, font=font)
+    return badge, bbox
+
+
 def add_size_watermark(image: Image.Image, original_width: int, original_height: int, font_size: Optional[int] = None) -> Image.Image:
     """
     在图片上添加尺寸水印（显示原始图片尺寸）
@@ -612,23 +908,11 @@ def add_size_watermark(image: Image.Image, original_width: int, original_height:
     
     # 创建图片副本
     result_img = image.copy()
-    draw = ImageDraw.Draw(result_img)
-
-    # 水印为英文，使用常见英文字体避免乱码
-    font = None
-    for name in ['DejaVuSans.ttf', 'arial.ttf', 'Arial.ttf']:
-        try:
-            font = ImageFont.truetype(name, font_size)
-            break
-        except Exception:
-            continue
-    if font is None:
-        font = ImageFont.load_default()
 
-    bbox = draw.textbbox((0, 0), size_text, font=font)
+    badge, bbox = _render_size_badge(size_text, font_size)
     text_width = bbox[2] - bbox[0]
     text_height = bbox[3] - bbox[1]
     x = (width - text_width) // 2
     y = int(height * 0.97) - text_height
-    draw.text((x, y), size_text, fill=(0, 0, 0), font=font)
+    result_img.paste((0, 0, 0), (x, y, x + badge.width, y + badge.height), badge)
     return result_img